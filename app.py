@@ -1,14 +1,13 @@
 import streamlit as st
 import os
-from datetime import datetime
-from utils.openai_helper import send_message_with_retries
-from utils.file_operations import ensure_directory_exists, render_manim_script, extract_code_blocks
-from utils.prompt_construction import one_shot_prompt
+from utils.file_operations import ensure_directory_exists
+from utils.catalogue import video_path
+from utils.job_queue import ACTIVE_STATUSES, PUBLISH_ACTIVE_STATUSES, cancel_job, poll_job, submit_job
 
 def display_video(operation):
     # Generate the file paths for both MP4 and GIF
-    mp4_file_path = os.path.join(final_video_dir, f"{operation.replace(' ', '_')}.mp4")
-    gif_file_path = os.path.join(final_video_dir, f"{operation.replace(' ', '_')}.gif")
+    mp4_file_path = video_path(operation, final_video_dir)
+    gif_file_path = video_path(operation, final_video_dir, extension="gif")
 
     if os.path.exists(mp4_file_path):
         # Adjusted to fit within the column
@@ -41,6 +40,113 @@ def display_video(operation):
     else:
         st.warning(f"Video for {operation} is not available yet.")
 
+def show_job_progress(job):
+    if job["status"] == "queued":
+        st.progress(0.0, text="Waiting for a free worker...")
+    elif job["status"] == "generating":
+        st.progress(0.0, text="Generating Manim script...")
+    elif job["queue_position"] is not None:
+        st.progress(0.0, text=f"Waiting for a free render slot: number {job['queue_position']} in the queue...")
+    elif job["progress"] is None:
+        st.progress(0.0, text="Rendering video...")
+    else:
+        progress = job["progress"]
+        text = f"Rendering animation {progress['animation'] + 1}..."
+        if progress["remaining"] is not None:
+            text += f" about {progress['remaining']:.0f}s left"
+        st.progress(min(progress["fraction"], 0.99), text=text)
+
+def detach_generation():
+    # Gives up this session's interest in its job; the job keeps running for
+    # anyone else who asked for the same video
+    cancel_job(st.session_state.generation_job_id, st.session_state.generation_token)
+    st.session_state.generation_job_id = None
+    st.session_state.generation_token = None
+    st.query_params.pop("job", None)
+    st.query_params.pop("token", None)
+
+def generation_phase(job):
+    if job["status"] in ACTIVE_STATUSES:
+        return "running"
+    if job["publish_status"] in PUBLISH_ACTIVE_STATUSES:
+        return "publishing"
+    return "finished"
+
+@st.fragment(run_every=2)
+def watch_generation(job_id, phase):
+    # Polling also tells the job queue that someone is still waiting for the
+    # job. Only a running job is drawn here; once the phase changes the whole
+    # page is drawn again, and a finished job is no longer polled.
+    job = poll_job(job_id)
+    if job is None or generation_phase(job) != phase:
+        st.rerun()
+    if phase != "running":
+        return
+
+    show_job_progress(job)
+    if st.session_state.generation_token and st.button("Cancel"):
+        detach_generation()
+        st.rerun()
+    show_job(job)
+
+def show_job(job):
+    if job["status"] == "generating" and job["response_text"]:
+        # Streamed in while the model writes
+        st.code(job["response_text"], language='markdown')
+    elif job["response_text"]:
+        with st.expander("See Generated Code"):
+            st.code(job["response_text"], language='python')
+
+    if job["script_content"]:
+        with st.expander("See Manim Script"):
+            st.code(job["script_content"], language='python')
+
+    for attempt in job["attempts"]:
+        with st.expander("See Render Logs"):
+            if attempt.get("preflight_seconds") is not None:
+                if attempt["stage"] == "render":
+                    telemetry = f"Attempt {attempt['attempt']}: rendered in {attempt['render_seconds']:.1f}s"
+                else:
+                    telemetry = f"Attempt {attempt['attempt']}: failed the {attempt['stage']} check in {sum(attempt['preflight_seconds'].values()):.1f}s"
+                if attempt["repair_seconds"] is not None:
+                    telemetry += f", repaired in {attempt['repair_seconds']:.1f}s using about {attempt['repair_tokens']} tokens"
+                st.caption(telemetry)
+            st.write(attempt["stdout"])
+            st.write(attempt["stderr"])
+        if attempt["error"]:
+            st.error(f"An error occurred while rendering the video: {attempt['error']}")
+
+    if job["status"] == "failed":
+        st.error(f"An error occurred: {job['error']}")
+    elif job["status"] == "cancelled":
+        st.warning(job["error"])
+    elif job["status"] == "done":
+        if job["from_cache"]:
+            st.caption("This video was generated earlier for the same prompt and model.")
+        video_file_path = job["video_path"]
+        if job["publish_status"] == "done":
+            video_file_path = job["publish_video_path"]
+            st.text("See the rendered video below:")
+        elif job["publish_status"] in ("queued", "rendering"):
+            st.text("See the preview below. The full-quality video will replace it when it is ready.")
+        else:
+            st.text("See the rendered video below:")
+
+        if not os.path.exists(video_file_path):
+            # The result cache has evicted it since
+            st.warning("This video is no longer available. Generate it again.")
+            return
+
+        st.video(video_file_path)
+
+        with open(video_file_path, "rb") as file:
+            st.download_button(
+                label="Download Video",
+                data=file,
+                file_name=f"{job['operation']}_Python.mp4",
+                mime="video/mp4"
+            )
+
 # Directories for videos
 final_video_dir = "videos"
 ensure_directory_exists(final_video_dir)
@@ -144,16 +250,10 @@ st.markdown(
 )
 
 # Initialize session state
-if 'prompt' not in st.session_state:
-    st.session_state.prompt = ""
-if 'response_text' not in st.session_state:
-    st.session_state.response_text = ""
-if 'script_content' not in st.session_state:
-    st.session_state.script_content = ""
-if 'video_file_path' not in st.session_state:
-    st.session_state.video_file_path = ""
-if 'video_generated' not in st.session_state:
-    st.session_state.video_generated = False
+if 'generation_job_id' not in st.session_state:
+    # The job ID is kept in the URL, so a reload picks the job up again
+    st.session_state.generation_job_id = st.query_params.get("job")
+    st.session_state.generation_token = st.query_params.get("token")
 
 tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
     "📊 Column Selection",
@@ -289,79 +389,42 @@ with tab6:
         ]
     }
 
+    job = poll_job(st.session_state.generation_job_id)
+    if job is not None and "operation" not in st.session_state:
+        # Reattaching to a job after a reload: select its operation again
+        st.session_state.category = next(name for name, operations in categories.items() if job["operation"] in operations)
+        st.session_state.operation = job["operation"]
+
     category = st.selectbox("Select a Topic", list(categories.keys()), key="category")
     operation = st.radio("Select a Data Operation", categories[category], key="operation")
 
     st.markdown(f"**Category:** {category}")
     st.markdown(f"**Operation:** {operation}")
 
-    if st.button('Generate Video'):
-        st.session_state.prompt = one_shot_prompt(operation)
-
-        try:
-            with st.spinner('Generating Manim script...'):
-                st.session_state.response_text = send_message_with_retries(st.session_state.prompt)
-            with st.expander("See Generated Code"):
-                st.code(st.session_state.response_text, language='python')
-
-            # Extract Manim script
-            st.session_state.script_content = extract_code_blocks(st.session_state.response_text)[0].strip()
-            with st.expander("See Manim Script"):
-                st.code(st.session_state.script_content, language='python')
-
-            # Render the Manim Script
-            max_debug_attempts = 6
-            debug_attempts = 0
-            success = False
-
-            while debug_attempts < max_debug_attempts and not success:
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                video_dir = os.path.join("generated_videos", f"{operation}_Python_{timestamp}")
-                ensure_directory_exists(video_dir)
-
-                with st.spinner('Rendering video...'):
-                    stdout, stderr, error_message = render_manim_script(st.session_state.script_content, video_dir)
-                    with st.expander("See Render Logs"):
-                        st.write(stdout)
-                        st.write(stderr)
-
-                    if error_message:
-                        st.error(f"An error occurred while rendering the video: {error_message}")
-                        debug_attempts += 1
-                    else:
-                        success = True
-                        # Find the video file in the nested directories
-                        st.session_state.video_file_path = None
-                        for root, dirs, files in os.walk(video_dir):
-                            video_files = [f for f in files if f.endswith('.mp4')]
-                            if video_files:
-                                st.session_state.video_file_path = os.path.join(root, video_files[0])
-                                break
-
-                        st.session_state.video_generated = True
-
-        except Exception as e:
-            st.error(f"An error occurred: {e}")
-            st.session_state.video_generated = False
-
-    # Display previous state if available and video is generated successfully
-    if st.session_state.video_generated:
-        if st.session_state.response_text:
-            with st.expander("See Generated Code"):
-                st.code(st.session_state.response_text, language='python')
-
-        if st.session_state.script_content:
-            with st.expander("See Manim Script"):
-                st.code(st.session_state.script_content, language='python')
-
-        if st.session_state.video_file_path:
-            st.text("See the rendered video below:")
-            st.video(st.session_state.video_file_path)
-
-            with open(st.session_state.video_file_path, "rb") as file:
-                st.download_button(
-                    label="Download Video",
-                    data=file,
-                    file_name=f"{operation}_Python.mp4",
-                    mime="video/mp4"
-                )
+    if job is not None and job["operation"] != operation:
+        # Switching to another operation gives up on the previous one
+        detach_generation()
+        job = None
+
+    generate = st.button('Generate Video')
+    # A cached result can be thrown away and generated again from scratch
+    regenerate = job is not None and job["from_cache"] and st.button('Regenerate Video')
+    if generate or regenerate:
+        if st.session_state.generation_job_id:
+            detach_generation()
+        job_id, token = submit_job(operation, regenerate=bool(regenerate))
+        st.session_state.generation_job_id = job_id
+        st.session_state.generation_token = token
+        st.query_params["job"] = job_id
+        st.query_params["token"] = token
+
+    if st.session_state.generation_job_id:
+        job = poll_job(st.session_state.generation_job_id)
+        if job is None:
+            st.warning("This video generation job no longer exists.")
+        else:
+            phase = generation_phase(job)
+            if phase != "running":
+                show_job(job)
+            if phase != "finished":
+                watch_generation(job["job_id"], phase)
@@ -1,71 +1,9 @@
 from manim import *
+from utils.manim_toolkit import *
 
 class Filtering(Scene):
     def construct(self):
 
-        # -----Functions-----
-        def create_subtitle(text):
-            subtitle = Text(text).scale(0.5).to_edge(DOWN, buff=0.4)
-            return subtitle
-
-        def create_console(x, y, z, color_fill, code_text):
-            console_rect = Rectangle(width=x, height=y, stroke_width=1, fill_color=color_fill).set_fill(color_fill, 0.5).shift(z)
-            red_arrow_text = MarkupText(r'>>> ', color=RED_D, opacity=1).scale(0.45).next_to(console_rect.get_left(), RIGHT, buff=0.3)
-            code_text = Text(code_text, color=WHITE, opacity=1).scale(0.45).next_to(red_arrow_text, RIGHT, buff=0.1)
-            return VGroup(console_rect, red_arrow_text, code_text)
-
-        def create_dataframe(headers, data, pos_shift):
-            header_row = create_row([f'<b>{header}</b>' for header in headers], pos_shift, fill_color=GREY_D)
-            rows = [header_row]
-            for i, row_data in enumerate(data):
-                y_shift = pos_shift - (i + 1) * 0.35 * UP
-                rows.append(create_row(row_data, y_shift))
-            return rows
-
-        def create_row(texts, y_shift, fill_color=None):
-            row = []
-            previous_table = None
-            for text in texts:
-                table = create_cell(f'<span font_family="monospace">{text}</span>', fill_color)
-                if previous_table is None:
-                    table.shift(y_shift + 4.5 * LEFT)
-                else:
-                    table.next_to(previous_table, RIGHT, buff=0) 
-                row.append(table)
-                previous_table = table
-            return row
-
-        def create_cell(text, fill_color=None):
-            cell = Rectangle(width=3, height=0.6)
-            cell.set_stroke(color=GREY, opacity=1).scale(0.6)
-            if fill_color:
-                cell.set_fill(fill_color, opacity=1)
-            text = MarkupText(text).scale(0.4)
-            return VGroup(cell, text)
-
-        def create_index_column(indices, data_rows):
-            index_column = []
-            for i, index_value in enumerate(indices):
-                index = MarkupText(
-                    f'<span font_family="monospace"><b>{index_value}</b></span>',
-                    color=GREY_A,
-                    opacity=1
-                ).scale(0.45)
-                index.next_to(data_rows[i][0].get_left(), LEFT, buff=0.2)
-                index_column.append(index)
-            return index_column
-
-        def highlight_rows(rows, columns, color):
-            highlights = []
-            for row in rows:
-                for i in columns:
-                    highlight = create_highlight(3, 0.6, color).move_to(row[i].get_center())
-                    highlights.append(highlight)
-            return highlights
-
-        def create_highlight(x, y, color):
-            return Rectangle(width=x, height=y).set_stroke(color=color, opacity=1).set_fill(color=color, opacity=0.5).scale(0.6)
-
         # -----Title-----
         title = MarkupText('Filter with Comparison Operator: Less Than (&lt;)', color=GOLD).scale(0.7).shift(3.5 * UP)
         self.play(FadeIn(title))
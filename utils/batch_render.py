@@ -0,0 +1,184 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from importlib import metadata
+
+from utils.catalogue import operation_for_script, video_path
+from utils.file_operations import write_json_atomic
+from utils.render_worker import run_manim
+from utils.renderer import (
+    PROJECT_ROOT, RENDER_PROFILES, cache_args, collect_outputs, evict_cache, find_scenes,
+    profile_extension, profile_flags, save_to_cache,
+)
+
+SCRIPTS_DIR = os.path.join(PROJECT_ROOT, "scripts")
+VIDEO_DIR = os.path.join(PROJECT_ROOT, "videos")
+BUILD_DIR = os.path.join(PROJECT_ROOT, "build", "media")
+MANIFEST_NAME = "manifest.json"
+
+# Sources every scene depends on besides its own script
+SHARED_SOURCES = [os.path.join(PROJECT_ROOT, "utils", "manim_toolkit.py")]
+
+
+def manim_version():
+    try:
+        return metadata.version("manim")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def input_hash(job, flags, version):
+    digest = hashlib.sha256()
+    for path in [job["script_path"], *SHARED_SOURCES]:
+        with open(path, "rb") as file:
+            digest.update(file.read())
+    digest.update(job["scene_name"].encode())
+    digest.update(version.encode())
+    digest.update(" ".join(flags).encode())
+    return digest.hexdigest()
+
+
+def load_manifest(video_dir):
+    manifest_path = os.path.join(video_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def save_manifest(video_dir, manifest):
+    manifest_path = os.path.join(video_dir, MANIFEST_NAME)
+    write_json_atomic(manifest_path, manifest, sort_keys=True)
+
+
+def is_up_to_date(job, manifest):
+    entry = manifest.get(os.path.basename(job["output_path"]))
+    return entry is not None and entry["input_hash"] == job["input_hash"] and os.path.exists(job["output_path"])
+
+
+def read_script(script_path):
+    with open(script_path, "r", encoding="utf-8") as file:
+        return file.read()
+
+
+def discover_jobs(scripts_dir=SCRIPTS_DIR, video_dir=VIDEO_DIR, extension="mp4"):
+    jobs = []
+    for script_path in sorted(glob.glob(os.path.join(scripts_dir, "**", "*.py"), recursive=True)):
+        relative_path = os.path.relpath(script_path, PROJECT_ROOT)
+        operation = operation_for_script(relative_path)
+        if operation is None:
+            # Scripts outside the catalogue keep their file name
+            operation = os.path.splitext(os.path.basename(script_path))[0]
+        for scene_name in find_scenes(read_script(script_path)):
+            jobs.append({
+                "operation": operation,
+                "script_path": script_path,
+                "scene_name": scene_name,
+                "output_path": video_path(operation, video_dir, extension),
+            })
+    return jobs
+
+
+def render_job(job, flags, extension="mp4"):
+    media_dir = os.path.join(BUILD_DIR, os.path.splitext(os.path.basename(job["script_path"]))[0])
+    result = run_manim(
+        [*flags, job["script_path"], job["scene_name"], *cache_args(media_dir, read_script(job["script_path"]))],
+        cwd=PROJECT_ROOT
+    )
+    save_to_cache(media_dir)
+    collect_outputs(result, media_dir, job["scene_name"], job["output_path"], extension)
+
+    error_message = None
+    if not result.ok:
+        lines = (result.error_message or "").strip().splitlines()
+        error_message = lines[-1] if lines else f"render {result.status}"
+    return {**job, "seconds": result.wall_time, "peak_memory_kb": result.peak_memory_kb, "error": error_message}
+
+
+def render_all(jobs, flags, workers=None, extension="mp4", on_result=None):
+    # on_result is called with each result as soon as its job finishes, so
+    # finished work is kept even if a later job or the batch fails
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(render_job, job, flags, extension): job for job in jobs}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as error:
+                result = {**futures[future], "seconds": 0.0, "peak_memory_kb": 0, "error": f"{type(error).__name__}: {error}"}
+            status = "failed" if result["error"] else "done"
+            print(f"[{status}] {result['operation']} ({result['seconds']:.1f}s)", flush=True)
+            results.append(result)
+            if on_result is not None:
+                on_result(result)
+    evict_cache()
+    return results
+
+
+def print_timing_table(results, wall_time):
+    width = max([len(result["operation"]) for result in results] + [len("Scene")])
+    print()
+    print(f"{'Scene':<{width}}  {'Seconds':>8}  {'Peak MB':>8}  Status")
+    print(f"{'-' * width}  {'-' * 8}  {'-' * 8}  ------")
+    for result in sorted(results, key=lambda r: r["seconds"], reverse=True):
+        status = f"FAILED: {result['error']}" if result["error"] else "ok"
+        print(f"{result['operation']:<{width}}  {result['seconds']:>8.1f}  {result['peak_memory_kb'] / 1024:>8.0f}  {status}")
+    total = sum(result["seconds"] for result in results)
+    print(f"{'-' * width}  {'-' * 8}  {'-' * 8}  ------")
+    print(f"{'Sum of renders':<{width}}  {total:>8.1f}")
+    print(f"{'Wall clock':<{width}}  {wall_time:>8.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render every scene under scripts/ into videos/.")
+    parser.add_argument("operations", nargs="*", help="Only render these operations (default: all)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument("--profile", default="publish", choices=list(RENDER_PROFILES), help="Render profile")
+    parser.add_argument("--scripts-dir", default=SCRIPTS_DIR)
+    parser.add_argument("--output-dir", default=VIDEO_DIR)
+    parser.add_argument("--force", action="store_true", help="Re-render even if the manifest says a video is current")
+    args = parser.parse_args(argv)
+
+    flags = profile_flags(args.profile)
+    extension = profile_extension(args.profile)
+    jobs = discover_jobs(args.scripts_dir, args.output_dir, extension)
+    if args.operations:
+        jobs = [job for job in jobs if job["operation"] in args.operations]
+
+    version = manim_version()
+    manifest = load_manifest(args.output_dir)
+    for job in jobs:
+        job["input_hash"] = input_hash(job, flags, version)
+    stale_jobs = [job for job in jobs if args.force or not is_up_to_date(job, manifest)]
+    if len(stale_jobs) < len(jobs):
+        print(f"{len(jobs) - len(stale_jobs)} scenes are up to date.")
+    if not stale_jobs:
+        print("No scenes to render.")
+        return 0
+
+    def record(result):
+        if result["error"]:
+            return
+        manifest[os.path.basename(result["output_path"])] = {
+            "script": os.path.relpath(result["script_path"], PROJECT_ROOT),
+            "scene": result["scene_name"],
+            "input_hash": result["input_hash"],
+            "manim_version": version,
+            "profile": args.profile,
+            "flags": flags,
+        }
+        save_manifest(args.output_dir, manifest)
+
+    print(f"Rendering {len(stale_jobs)} scenes with {args.jobs} workers...")
+    start = time.perf_counter()
+    results = render_all(stale_jobs, flags, workers=args.jobs, extension=extension, on_result=record)
+    print_timing_table(results, time.perf_counter() - start)
+    return 1 if any(result["error"] for result in results) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,47 @@
+import os
+
+# Prerecorded videos shown in the catalogue tabs, keyed by operation name,
+# with the scene script that renders each of them.
+CATALOGUE = {
+    "Select Columns by Name": "scripts/selection/1_select_column_name.py",
+    "Select Columns by Index": "scripts/selection/2_select_column_index.py",
+    "Select Rows by Index": "scripts/selection/3_select_row_iloc.py",
+    "Select Rows by Name": "scripts/selection/4_select_row_loc.py",
+    "Filter with Equal": "scripts/filtering/1_filter_equal.py",
+    "Filter with Greater Than": "scripts/filtering/2_filter_greater.py",
+    "Filter with Less Than": "scripts/filtering/3_filter_less.py",
+    "Filter with Not Equal": "scripts/filtering/4_filter_notequal.py",
+    "Filter with AND": "scripts/filtering/5_filter_and.py",
+    "Filter with OR": "scripts/filtering/6_filter_or.py",
+    "Filter with NULL Values": "scripts/filtering/7_filter_null.py",
+    "Sum Aggregation": "scripts/grouping_aggregation/1_sum.py",
+    "Mean Aggregation": "scripts/grouping_aggregation/2_mean.py",
+    "Group by": "scripts/grouping_aggregation/3_groupby.py",
+    "Group by with Aggregation": "scripts/grouping_aggregation/4_groupby_aggregate.py",
+    "Group by with Filtering": "scripts/grouping_aggregation/5_having.py",
+    "Left Join": "scripts/joining/1_left_join.py",
+    "Right Join": "scripts/joining/2_right_join.py",
+    "Inner Join": "scripts/joining/3_inner_join.py",
+    "Outer Join": "scripts/joining/4_outer_join.py",
+    "Concat Horizontally": "scripts/reshaping/1_concat_horizontally.py",
+    "Concat Vertically": "scripts/reshaping/2_concat_vertically.py",
+    "Pivot Table": "scripts/reshaping/3_pivot_table.py",
+    "Data Melting": "scripts/reshaping/4_melt.py",
+    "Stack": "scripts/reshaping/5_stack.py",
+}
+
+
+def video_file_name(operation, extension="mp4"):
+    return f"{operation.replace(' ', '_')}.{extension}"
+
+
+def video_path(operation, video_dir="videos", extension="mp4"):
+    return os.path.join(video_dir, video_file_name(operation, extension))
+
+
+def operation_for_script(script_path):
+    script_path = os.path.normpath(script_path)
+    for operation, path in CATALOGUE.items():
+        if os.path.normpath(path) == script_path:
+            return operation
+    return None
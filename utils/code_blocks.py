@@ -0,0 +1,35 @@
+OPENING_FENCE = "```python"
+CLOSING_FENCE = "```"
+
+
+class CodeBlockExtractor:
+    # Finds ```python blocks in text that arrives in pieces and reports each
+    # one as soon as its closing fence arrives. Matches extract_code_blocks.
+    def __init__(self):
+        self.text = ""
+        self.blocks = []
+        self._search_from = 0
+        self._block_start = None
+
+    def feed(self, chunk):
+        # Returns the blocks completed by this chunk
+        self.text += chunk
+        completed = []
+        while True:
+            if self._block_start is None:
+                start = self.text.find(OPENING_FENCE, self._search_from)
+                if start == -1:
+                    # A fence may be split across chunks
+                    self._search_from = max(self._search_from, len(self.text) - len(OPENING_FENCE) + 1)
+                    break
+                self._block_start = start + len(OPENING_FENCE)
+                self._search_from = self._block_start
+            end = self.text.find(CLOSING_FENCE, self._search_from)
+            if end == -1:
+                self._search_from = max(self._search_from, len(self.text) - len(CLOSING_FENCE) + 1)
+                break
+            completed.append(self.text[self._block_start:end])
+            self._block_start = None
+            self._search_from = end + len(CLOSING_FENCE)
+        self.blocks.extend(completed)
+        return completed
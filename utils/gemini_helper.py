@@ -1,21 +1,40 @@
 import google.generativeai as genai
+import asyncio
 import os
-import time
+from utils.llm_providers import DEFAULT_MODELS, generate_text
+from utils.llm_retry import LLM_COMPLETION_TOKENS_ESTIMATE, acquire_rate_limit, estimate_tokens, settle_rate_limit
 from dotenv import load_dotenv
 
-# Load API key from .env file
-load_dotenv()
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-genai.configure(api_key=GOOGLE_API_KEY)
+_configured = False
 
-def send_gemini_message_with_retries(prompt, model="gemini-1.5-pro", max_retries=3):
-    retry_wait = 60
-    for attempt in range(max_retries):
-        try:
-            response = genai.GenerativeModel(model).generate_content(prompt)
-            return response.text
-        except Exception as e:
-            print(f"An error occurred: {e}")
-            time.sleep(retry_wait)
-            retry_wait *= 2
-    raise Exception("Max retries exceeded")
+
+def _configure():
+    # On first use, so the app starts without the key
+    global _configured
+    if not _configured:
+        # Load API key from .env file
+        load_dotenv()
+        google_api_key = os.getenv("GOOGLE_API_KEY")
+        if not google_api_key:
+            raise RuntimeError("GOOGLE_API_KEY is not set in .env or the environment.")
+        genai.configure(api_key=google_api_key)
+        _configured = True
+
+
+async def complete(prompt, model, system_message, on_text=None):
+    _configure()
+    reserved = estimate_tokens(system_message, prompt) + LLM_COMPLETION_TOKENS_ESTIMATE
+    await acquire_rate_limit("gemini", reserved)
+    # The SDK call blocks, so it runs on a thread off the event loop
+    generative_model = genai.GenerativeModel(model, system_instruction=system_message or None)
+    response = await asyncio.to_thread(generative_model.generate_content, prompt)
+    settle_rate_limit("gemini", estimate_tokens(system_message, prompt, response.text) - reserved)
+    if on_text is not None:
+        on_text(response.text)
+    return response.text
+
+
+def send_gemini_message_with_retries(prompt, model=DEFAULT_MODELS["gemini"], max_retries=3, cancel=None, on_wait=None, use_cache=True):
+    # Blocking wrapper kept for existing callers; new code should use
+    # llm_providers.generate_text
+    return generate_text(prompt, max_retries, cancel, on_wait, use_cache=use_cache, provider="gemini", model=model, hedge_provider="")
@@ -0,0 +1,45 @@
+import asyncio
+import threading
+from concurrent.futures import FIRST_COMPLETED, wait
+
+# A generation job's cancel token is a threading.Event. LLM calls and renders
+# started for the job check it, so setting it stops waiting on the LLM and
+# kills the manim process group.
+POLL_SECONDS = 0.5
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+class GenerationCancelled(Exception):
+    pass
+
+
+def _wait_cancellable(future, cancel, on_wait):
+    while not wait([future], POLL_SECONDS, return_when=FIRST_COMPLETED).done:
+        if cancel is not None and cancel.is_set():
+            future.cancel()
+            raise GenerationCancelled()
+        if on_wait is not None:
+            on_wait()
+    return future.result()
+
+
+def background_loop():
+    # One event loop per process, on a daemon thread, shared by every caller
+    # so async clients can pool their connections
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, daemon=True, name="async-loop").start()
+    return _loop
+
+
+def run_coroutine(coroutine, cancel=None, on_wait=None):
+    # Runs coroutine on the background loop and waits for it from a plain
+    # thread. Cancelling also cancels the coroutine, so an HTTP request in
+    # flight is closed rather than abandoned.
+    future = asyncio.run_coroutine_threadsafe(coroutine, background_loop())
+    return _wait_cancellable(future, cancel, on_wait)
+
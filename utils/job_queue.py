@@ -0,0 +1,451 @@
+import fcntl
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from datetime import datetime
+
+from utils.file_operations import PROJECT_ROOT, ensure_directory_exists, extract_code_blocks, write_json_atomic
+from utils.generation_jobs import GenerationCancelled
+from utils.llm_providers import generate_text, model_label
+from utils.llm_retry import estimate_tokens
+from utils.prompt_construction import one_shot_prompt
+from utils.render_worker import render_script
+from utils.repair_engine import REPAIR_MAX_SECONDS, render_with_repairs
+from utils.renderer import estimate_animation_count, progress_estimate, write_render_log
+from utils.result_cache import evict_results, key_digest, lookup_result, store_result
+
+# "Generate Video" jobs run the prompt, repair and render cycle in a pool of
+# worker processes. Each job's state lives in a JSON file, so the app only
+# submits and polls, and a job outlives the Streamlit rerun or connection that
+# started it. A job nobody has polled for ABANDON_SECONDS is cancelled.
+# Identical requests (same operation, prompt, model and render profile) made
+# while a job is in flight attach to that job instead of starting another,
+# and requests that already finished are served from the result cache.
+# Once the preview is done, the full-quality publish render runs as a separate
+# job in its own pool of PUBLISH_WORKERS processes, at low render priority, so
+# it holds neither a generation worker nor a render slot a preview is waiting
+# for.
+# Finished jobs nobody has polled for GENERATION_JOB_RETENTION_SECONDS are
+# deleted.
+GENERATED_DIR = os.path.join(PROJECT_ROOT, "generated_videos")
+JOBS_DIR = os.environ.get("GENERATION_JOBS_DIR", os.path.join(GENERATED_DIR, "jobs"))
+GENERATION_WORKERS = int(os.environ.get("GENERATION_WORKERS", 2))
+PUBLISH_WORKERS = int(os.environ.get("GENERATION_PUBLISH_WORKERS", 1))
+ABANDON_SECONDS = float(os.environ.get("GENERATION_ABANDON_SECONDS", 60))
+RETENTION_SECONDS = float(os.environ.get("GENERATION_JOB_RETENTION_SECONDS", 24 * 60 * 60))
+PROFILE = "preview"
+POLL_SECONDS = 1.0
+
+ACTIVE_STATUSES = ("queued", "generating", "rendering")
+PUBLISH_ACTIVE_STATUSES = ("queued", "rendering")
+
+_executors = {}
+_futures = {}
+_publish_futures = {}
+
+
+def _job_path(job_id):
+    return os.path.join(JOBS_DIR, f"{job_id}.json")
+
+
+@contextmanager
+def _locked(job_id):
+    # The app and the worker process both update a job
+    with open(os.path.join(JOBS_DIR, f"{job_id}.lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def _read_job(job_id):
+    try:
+        with open(_job_path(job_id), "r", encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def _write_job(job):
+    job["updated"] = time.time()
+    write_json_atomic(_job_path(job["job_id"]), job)
+
+
+def load_job(job_id):
+    if not job_id or not os.path.exists(_job_path(job_id)):
+        return None
+    with _locked(job_id):
+        return _read_job(job_id)
+
+
+def update_job(job_id, **changes):
+    with _locked(job_id):
+        job = _read_job(job_id)
+        job.update(changes)
+        _write_job(job)
+    return job
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _new_executor(workers):
+    # spawn, because forking the threaded Streamlit server is not safe
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def _submit(function, job_id, workers):
+    # Each function has its own pool
+    if function not in _executors:
+        _executors[function] = _new_executor(workers)
+    try:
+        return _executors[function].submit(function, job_id)
+    except BrokenProcessPool:
+        # A worker process died and took the pool with it
+        _executors[function] = _new_executor(workers)
+        return _executors[function].submit(function, job_id)
+
+
+def _enqueue(job_id):
+    _futures[job_id] = _submit(_run_job, job_id, GENERATION_WORKERS)
+    _futures[job_id].add_done_callback(lambda future: _publish_when_ready(job_id))
+
+
+def _enqueue_publish(job_id):
+    _publish_futures[job_id] = _submit(_run_publish, job_id, PUBLISH_WORKERS)
+
+
+def _publish_when_ready(job_id):
+    # Runs when the generation finishes, in the process that queued it
+    job = load_job(job_id)
+    if job is not None and job["publish_status"] == "queued" and job_id not in _publish_futures:
+        _enqueue_publish(job_id)
+
+
+def request_key(operation, prompt, model=None, profile=PROFILE):
+    model = model or model_label()
+    prompt_version = hashlib.sha256(prompt.encode()).hexdigest()[:16]
+    return {"operation": operation, "prompt_version": prompt_version, "model": model, "profile": profile}
+
+
+def _inflight_path(key):
+    return os.path.join(JOBS_DIR, "inflight", f"{key_digest(key)}.txt")
+
+
+def _attach(key, token):
+    # The in-flight job for key that can still take another requester, if any
+    try:
+        with open(_inflight_path(key), "r", encoding="utf-8") as file:
+            job_id = file.read().strip()
+    except FileNotFoundError:
+        return None
+    if load_job(job_id) is None:
+        return None
+    with _locked(job_id):
+        job = _read_job(job_id)
+        if job["status"] not in ACTIVE_STATUSES or job["cancel_requested"]:
+            return None
+        job["subscribers"].append(token)
+        job["last_seen"] = time.time()
+        _write_job(job)
+    return job_id
+
+
+def _leave_inflight(job):
+    with _locked("inflight"):
+        path = _inflight_path(job["key"])
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                if file.read().strip() == job["job_id"]:
+                    os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _new_job(operation, key, prompt, **fields):
+    now = time.time()
+    job = {
+        "job_id": uuid.uuid4().hex,
+        "operation": operation,
+        "key": key,
+        "model": key["model"],
+        "status": "queued",
+        "created": now,
+        "last_seen": now,
+        "subscribers": [],
+        "cancel_requested": False,
+        "from_cache": False,
+        "regenerate": False,
+        # The server process that queued the job, and when
+        "owner_pid": os.getpid(),
+        "enqueued": now,
+        "worker_pid": None,
+        "publish_pid": None,
+        "prompt": prompt,
+        "response_text": "",
+        "script_content": "",
+        "attempts": [],
+        "progress": None,
+        "queue_position": None,
+        "video_dir": None,
+        "video_path": None,
+        "publish_status": None,
+        "publish_video_path": None,
+        "error": None,
+    }
+    job.update(fields)
+    with _locked(job["job_id"]):
+        _write_job(job)
+    return job["job_id"]
+
+
+def submit_job(operation, regenerate=False):
+    # Returns the ID of a job for operation: served from the result cache, an
+    # identical job already in flight, or a new one. regenerate skips the
+    # result cache and the LLM response cache. Also returns the requester's
+    # token, which cancel_job takes to detach this requester only.
+    ensure_directory_exists(os.path.join(JOBS_DIR, "inflight"))
+    cleanup_jobs()
+    prompt = one_shot_prompt(operation)
+    key = request_key(operation, prompt)
+    token = uuid.uuid4().hex
+    cached = None if regenerate else lookup_result(key)
+    if cached is not None:
+        return _new_job(
+            operation, key, prompt, status="done", subscribers=[token], from_cache=True, response_text=cached["response_text"],
+            script_content=cached["script_content"], video_path=cached["videos"][PROFILE],
+            publish_status="done" if "publish" in cached["videos"] else None, publish_video_path=cached["videos"].get("publish")
+        ), token
+
+    with _locked("inflight"):
+        job_id = _attach(key, token)
+        if job_id is not None:
+            return job_id, token
+        job_id = _new_job(operation, key, prompt, subscribers=[token], regenerate=regenerate)
+        with open(_inflight_path(key), "w", encoding="utf-8") as file:
+            file.write(job_id)
+    _enqueue(job_id)
+    return job_id, token
+
+
+def cancel_job(job_id, token):
+    # Detaches the requester holding token; detaching again does nothing. The
+    # job is only cancelled once nobody wants it.
+    if load_job(job_id) is None:
+        return
+    with _locked(job_id):
+        job = _read_job(job_id)
+        if token not in job["subscribers"]:
+            return
+        job["subscribers"].remove(token)
+        if not job["subscribers"]:
+            job["cancel_requested"] = True
+        _write_job(job)
+
+
+def cleanup_jobs():
+    # Deletes the files of finished jobs nobody has polled for RETENTION_SECONDS
+    for name in os.listdir(JOBS_DIR):
+        if not name.endswith(".json"):
+            continue
+        job_id = name[:-len(".json")]
+        with _locked(job_id):
+            job = _read_job(job_id)
+            if job is None or job["status"] in ACTIVE_STATUSES or job["publish_status"] in PUBLISH_ACTIVE_STATUSES:
+                continue
+            if time.time() - job["last_seen"] < RETENTION_SECONDS:
+                continue
+            os.remove(_job_path(job_id))
+            os.remove(os.path.join(JOBS_DIR, f"{job_id}.lock"))
+
+
+def poll_job(job_id):
+    # Returns the job and records that someone is still watching it
+    if load_job(job_id) is None:
+        return None
+    with _locked(job_id):
+        job = _read_job(job_id)
+        job["last_seen"] = time.time()
+        future = _futures.get(job_id)
+        if job["status"] == "queued" and future is None:
+            # Another server process queued it; take it over only if that
+            # process has stopped, or the job would run twice
+            if job["owner_pid"] != os.getpid() and not _pid_alive(job["owner_pid"]):
+                job["owner_pid"] = os.getpid()
+                job["enqueued"] = time.time()
+                _enqueue(job_id)
+        elif job["status"] == "queued" and future.done() and future.exception() is not None:
+            job["status"] = "failed"
+            job["error"] = f"The job could not be started: {future.exception()}"
+        elif job["status"] in ACTIVE_STATUSES and job["worker_pid"] and not _pid_alive(job["worker_pid"]):
+            job["status"] = "failed"
+            job["error"] = "The worker running this job stopped unexpectedly."
+
+        publish_future = _publish_futures.get(job_id)
+        if job["publish_status"] == "queued" and publish_future is None:
+            # Same takeover rule as for generating
+            if job["owner_pid"] != os.getpid() and not _pid_alive(job["owner_pid"]):
+                job["owner_pid"] = os.getpid()
+                _enqueue_publish(job_id)
+        elif job["publish_status"] == "queued" and publish_future.done() and publish_future.exception() is not None:
+            job["publish_status"] = "failed"
+        elif job["publish_status"] == "rendering" and not _pid_alive(job["publish_pid"]):
+            job["publish_status"] = "failed"
+        _write_job(job)
+    return job
+
+
+def _abandoned(job):
+    return job["cancel_requested"] or time.time() - job["last_seen"] > ABANDON_SECONDS
+
+
+def _watch_job(job_id, cancel, finished):
+    while not finished.wait(POLL_SECONDS):
+        if _abandoned(load_job(job_id)):
+            cancel.set()
+            return
+
+
+def _progress_writer(job_id, script_content):
+    # Render progress callback; writes at most once per POLL_SECONDS
+    expected_animations = estimate_animation_count(script_content)
+    last_write = [0.0]
+
+    def update(progress):
+        if time.monotonic() - last_write[0] < POLL_SECONDS:
+            return
+        last_write[0] = time.monotonic()
+        fraction, remaining = progress_estimate(progress, expected_animations)
+        update_job(job_id, progress={"animation": progress["animation"], "fraction": fraction, "remaining": remaining})
+
+    return update
+
+
+def _text_writer(job_id):
+    # Streaming callback; shows the response in the app while it is written
+    last_write = [0.0]
+
+    def update(text):
+        if time.monotonic() - last_write[0] < POLL_SECONDS:
+            return
+        last_write[0] = time.monotonic()
+        update_job(job_id, response_text=text)
+
+    return update
+
+
+def _generate(job_id, cancel):
+    # The repair engine's time budget covers the first answer too
+    started = time.monotonic()
+    job = update_job(job_id, status="generating")
+    try:
+        response_text = generate_text(
+            job["prompt"], cancel=cancel, on_text=_text_writer(job_id), use_cache=not job["regenerate"], timeout=REPAIR_MAX_SECONDS
+        )
+    except TimeoutError:
+        raise RuntimeError(f"The LLM did not answer within the time budget of {REPAIR_MAX_SECONDS:.0f}s.")
+    script_content = extract_code_blocks(response_text)[0].strip()
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    video_dir = os.path.join(GENERATED_DIR, f"{job['operation']}_Python_{timestamp}_{job_id[:8]}")
+    update_job(job_id, status="rendering", response_text=response_text, script_content=script_content, video_dir=video_dir)
+
+    result, report = render_with_repairs(
+        script_content, video_dir, profile=PROFILE, tokens_used=estimate_tokens(job["prompt"], response_text),
+        on_progress=_progress_writer(job_id, script_content), cancel=cancel,
+        on_queue=lambda position: update_job(job_id, queue_position=position),
+        on_attempt=lambda attempts, script: update_job(job_id, script_content=script, attempts=attempts, progress=None),
+        use_cache=not job["regenerate"], started=started
+    )
+    script_content = result.script_content
+    if not result.ok:
+        raise RuntimeError(f"An error occurred while rendering the video ({report['stop_reason']}): {result.error_message}")
+
+    # Show the preview now; the publish job swaps in the full-quality render
+    videos = store_result(job["key"], script_content, response_text, {PROFILE: result.video_path})
+    update_job(job_id, status="done", script_content=script_content, video_path=videos[PROFILE], publish_status="queued")
+    evict_results()
+
+
+def _publish(job_id, cancel):
+    job = load_job(job_id)
+    video_dir = job["video_dir"]
+    publish = render_script(
+        job["script_content"], os.path.join(video_dir, "publish"), "publish", os.path.join(video_dir, "publish.mp4"), cancel=cancel,
+        low_priority=True
+    )
+    write_render_log(publish, os.path.join(video_dir, "publish.json"))
+    videos = {}
+    if publish.ok:
+        videos = store_result(job["key"], job["script_content"], job["response_text"], {"publish": publish.video_path})
+    status = publish.status
+    if publish.ok:
+        # The cache drops it when the preview's entry was evicted or replaced
+        status = "done" if "publish" in videos else "discarded"
+    update_job(job_id, publish_status=status, publish_video_path=videos.get("publish"))
+    evict_results()
+
+
+def _prune_run_dir(video_dir):
+    # A finished run keeps only its script and logs; its videos are in the
+    # result cache. This also drops the run's hard links to the render cache's
+    # partial movies, which would otherwise keep evicted files on disk.
+    for name in os.listdir(video_dir):
+        path = os.path.join(video_dir, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif not name.endswith((".json", ".py")):
+            os.remove(path)
+
+
+def _run_job(job_id):
+    # Runs in a pool worker process
+    job = update_job(job_id, worker_pid=os.getpid())
+    if _abandoned(job):
+        update_job(job_id, status="cancelled", error="Video generation was cancelled.")
+        return
+    cancel = threading.Event()
+    finished = threading.Event()
+    threading.Thread(target=_watch_job, args=(job_id, cancel, finished), daemon=True).start()
+    try:
+        _generate(job_id, cancel)
+    except GenerationCancelled:
+        update_job(job_id, status="cancelled", progress=None, error="Video generation was cancelled.")
+    except Exception as e:
+        update_job(job_id, status="failed", progress=None, error=str(e))
+    finally:
+        _leave_inflight(job)
+        finished.set()
+        video_dir = load_job(job_id)["video_dir"]
+        if video_dir and os.path.isdir(video_dir):
+            _prune_run_dir(video_dir)
+
+
+def _run_publish(job_id):
+    # Runs in a publish pool worker process
+    job = update_job(job_id, publish_status="rendering", publish_pid=os.getpid())
+    if _abandoned(job):
+        update_job(job_id, publish_status="cancelled")
+        return
+    cancel = threading.Event()
+    finished = threading.Event()
+    threading.Thread(target=_watch_job, args=(job_id, cancel, finished), daemon=True).start()
+    try:
+        _publish(job_id, cancel)
+    except Exception:
+        update_job(job_id, publish_status="failed")
+    finally:
+        finished.set()
+        _prune_run_dir(job["video_dir"])
@@ -0,0 +1,74 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from utils.file_operations import PROJECT_ROOT
+
+# Content-addressed LLM responses, keyed by model, system message and prompt,
+# so repeated generations and repair prompts cost no tokens. SQLite keeps it
+# safe to share between the app and the job worker processes. Entries expire
+# after LLM_CACHE_TTL_DAYS; past LLM_CACHE_MAX_BYTES the least recently used
+# ones are dropped.
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", os.path.join(PROJECT_ROOT, ".llm_cache.sqlite3"))
+LLM_CACHE_TTL_DAYS = float(os.environ.get("LLM_CACHE_TTL_DAYS", 30))
+LLM_CACHE_MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", 100 * 1024 ** 2))
+
+
+@contextmanager
+def _transaction(path):
+    connection = sqlite3.connect(path, timeout=30)
+    try:
+        connection.execute("PRAGMA journal_mode=WAL")
+        with connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT, response TEXT, size INTEGER, created REAL, last_used REAL)"
+            )
+            yield connection
+    finally:
+        connection.close()
+
+
+def response_key(model, system_message, prompt):
+    return hashlib.sha256(json.dumps([model, system_message, prompt]).encode()).hexdigest()
+
+
+def get_cached_response(model, system_message, prompt, path=LLM_CACHE_PATH, ttl_days=LLM_CACHE_TTL_DAYS):
+    key = response_key(model, system_message, prompt)
+    with _transaction(path) as connection:
+        row = connection.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if time.time() - row[1] > ttl_days * 86400:
+            connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+        connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+    return row[0]
+
+
+def cache_response(model, system_message, prompt, response, path=LLM_CACHE_PATH, max_bytes=LLM_CACHE_MAX_BYTES,
+                   ttl_days=LLM_CACHE_TTL_DAYS):
+    now = time.time()
+    with _transaction(path) as connection:
+        connection.execute(
+            "INSERT OR REPLACE INTO responses (key, model, response, size, created, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+            (response_key(model, system_message, prompt), model, response, len(response.encode()), now, now)
+        )
+        evict_responses(connection, max_bytes, ttl_days)
+
+
+def evict_responses(connection, max_bytes=LLM_CACHE_MAX_BYTES, ttl_days=LLM_CACHE_TTL_DAYS):
+    connection.execute("DELETE FROM responses WHERE created < ?", (time.time() - ttl_days * 86400,))
+    total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+    if total <= max_bytes:
+        return
+    stale_keys = []
+    for key, size in connection.execute("SELECT key, size FROM responses ORDER BY last_used"):
+        if total <= max_bytes:
+            break
+        stale_keys.append((key,))
+        total -= size
+    connection.executemany("DELETE FROM responses WHERE key = ?", stale_keys)
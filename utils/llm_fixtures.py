@@ -0,0 +1,55 @@
+import asyncio
+import json
+import os
+import re
+
+from utils.file_operations import PROJECT_ROOT, write_json_atomic
+from utils.llm_cache import response_key
+
+# Record and replay of LLM completions, so the generate, render and repair
+# loop can be benchmarked offline and reproducibly. With LLM_FIXTURE_MODE set
+# to "record", every completion (first answers, broken scripts and repair
+# answers alike) is saved to LLM_FIXTURE_DIR along with how long it took; with
+# "replay", completions are served from there and no provider is called.
+# Replayed latency is the recorded one times LLM_REPLAY_LATENCY_SCALE plus
+# LLM_REPLAY_EXTRA_SECONDS.
+LLM_FIXTURE_MODE = os.environ.get("LLM_FIXTURE_MODE", "")
+LLM_FIXTURE_DIR = os.environ.get("LLM_FIXTURE_DIR", os.path.join(PROJECT_ROOT, "llm_fixtures"))
+LLM_REPLAY_LATENCY_SCALE = float(os.environ.get("LLM_REPLAY_LATENCY_SCALE", 1))
+LLM_REPLAY_EXTRA_SECONDS = float(os.environ.get("LLM_REPLAY_EXTRA_SECONDS", 0))
+
+
+class FixtureMissing(LookupError):
+    pass
+
+
+def normalise_prompt(prompt):
+    # Repair prompts quote manim errors, whose tracebacks name per-run
+    # directories and object addresses; only the file names are kept
+    prompt = re.sub(r"(?:/[\w.\-]+)+/", "", prompt)
+    return re.sub(r"0x[0-9a-fA-F]+", "0x0", prompt)
+
+
+def fixture_path(model, system_message, prompt, fixture_dir=LLM_FIXTURE_DIR):
+    return os.path.join(fixture_dir, f"{response_key(model, system_message, normalise_prompt(prompt))}.json")
+
+
+def record_fixture(provider, model, system_message, prompt, response, latency, fixture_dir=LLM_FIXTURE_DIR):
+    os.makedirs(fixture_dir, exist_ok=True)
+    path = fixture_path(model, system_message, prompt, fixture_dir)
+    fixture = {"provider": provider, "model": model, "prompt": prompt, "response": response, "latency": latency}
+    write_json_atomic(path, fixture)
+
+
+async def replay_fixture(model, system_message, prompt, on_text=None, fixture_dir=LLM_FIXTURE_DIR,
+                         latency_scale=LLM_REPLAY_LATENCY_SCALE, extra_seconds=LLM_REPLAY_EXTRA_SECONDS):
+    path = fixture_path(model, system_message, prompt, fixture_dir)
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            fixture = json.load(file)
+    except FileNotFoundError:
+        raise FixtureMissing(f"No recorded {model} response for this prompt in {fixture_dir}")
+    await asyncio.sleep(fixture["latency"] * latency_scale + extra_seconds)
+    if on_text is not None:
+        on_text(fixture["response"])
+    return fixture["response"]
@@ -0,0 +1,134 @@
+import ast
+import asyncio
+import importlib
+import os
+import time
+
+from utils.code_blocks import CodeBlockExtractor
+from utils.generation_jobs import run_coroutine
+from utils.llm_cache import cache_response, get_cached_response
+from utils.llm_fixtures import LLM_FIXTURE_MODE, record_fixture, replay_fixture
+from utils.llm_retry import call_with_retries, is_retryable
+
+# One interface over the LLM backends. A backend is a module with an async
+# complete(prompt, model, system_message, on_text) that makes a single
+# attempt; it may define is_retryable(error). Caching and retries happen here.
+# With LLM_HEDGE_PROVIDER set, a prompt the primary provider has not answered
+# with a valid script within LLM_HEDGE_AFTER_SECONDS is also sent to the hedge
+# provider, and the first valid script wins.
+BACKENDS = {
+    "openai": "utils.openai_helper",
+    "gemini": "utils.gemini_helper",
+    "stub": "utils.stub_llm",
+}
+DEFAULT_MODELS = {
+    "openai": "gpt-4o-2024-08-06",
+    "gemini": "gemini-1.5-pro",
+    "stub": "stub",
+}
+LLM_PROVIDER = os.environ.get("LLM_PROVIDER", "openai")
+LLM_HEDGE_PROVIDER = os.environ.get("LLM_HEDGE_PROVIDER", "")
+LLM_HEDGE_AFTER_SECONDS = float(os.environ.get("LLM_HEDGE_AFTER_SECONDS", 20))
+SYSTEM_MESSAGE = (
+    "You are an expert educator and animator specializing in creating educational videos using Manim. "
+    "Your task is to generate Python code for Manim that explains a specific data operation step-by-step. "
+    "Follow the instructions provided in the user prompt carefully, focusing on generating a single resultant DataFrame after demonstrating the original DataFrame. "
+    "Ensure that the code is well-structured, includes detailed comments, and provides clear explanations with corresponding subtitles. "
+    "It is crucial that the resultant DataFrame accurately reflects the data operation applied to the original DataFrame. "
+    "Double-check that all rows meeting the criteria are included and that the resulting data matches the expected output exactly. "
+    "Voiceovers are not required."
+)
+
+
+def backend(provider):
+    # Imported on first use, so only the SDKs that are used need installing
+    return importlib.import_module(BACKENDS[provider])
+
+
+def model_label(provider=None, hedge_provider=None):
+    # Names the configured providers and models, e.g. for result cache keys
+    provider = provider or LLM_PROVIDER
+    hedge_provider = LLM_HEDGE_PROVIDER if hedge_provider is None else hedge_provider
+    label = f"{provider}:{DEFAULT_MODELS[provider]}"
+    if hedge_provider:
+        label += f"+{hedge_provider}:{DEFAULT_MODELS[hedge_provider]}"
+    return label
+
+
+def has_valid_script(text):
+    extractor = CodeBlockExtractor()
+    extractor.feed(text)
+    if not extractor.blocks:
+        return False
+    try:
+        ast.parse(extractor.blocks[0])
+    except SyntaxError:
+        return False
+    return True
+
+
+async def complete_async(prompt, provider=None, model=None, max_retries=3, on_text=None, use_cache=True):
+    # use_cache=False skips the cached response but still stores the new one
+    provider = provider or LLM_PROVIDER
+    model = model or DEFAULT_MODELS[provider]
+    if LLM_FIXTURE_MODE == "replay":
+        return await replay_fixture(model, SYSTEM_MESSAGE, prompt, on_text)
+    # Recording skips the cache so every completion is captured
+    if use_cache and LLM_FIXTURE_MODE != "record":
+        cached = get_cached_response(model, SYSTEM_MESSAGE, prompt)
+        if cached is not None:
+            if on_text is not None:
+                on_text(cached)
+            return cached
+    module = backend(provider)
+    start = time.monotonic()
+    text = await call_with_retries(
+        lambda: module.complete(prompt, model, SYSTEM_MESSAGE, on_text), max_retries, getattr(module, "is_retryable", is_retryable)
+    )
+    if LLM_FIXTURE_MODE == "record":
+        record_fixture(provider, model, SYSTEM_MESSAGE, prompt, text, time.monotonic() - start)
+    cache_response(model, SYSTEM_MESSAGE, prompt, text)
+    return text
+
+
+async def hedged_complete_async(prompt, provider=None, hedge_provider=None, hedge_after=LLM_HEDGE_AFTER_SECONDS, max_retries=3,
+                                on_text=None, use_cache=True, model=None):
+    # The primary request streams to on_text; the hedge is only shown if it
+    # wins. If neither returns a valid script, the primary's outcome is used.
+    hedge_provider = LLM_HEDGE_PROVIDER if hedge_provider is None else hedge_provider
+    primary = asyncio.ensure_future(complete_async(prompt, provider, model, max_retries, on_text, use_cache))
+    if not hedge_provider:
+        return await primary
+    tasks = [primary]
+    pending = {primary}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=hedge_after if len(tasks) == 1 else None, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None and has_valid_script(task.result()):
+                    if task is not primary and on_text is not None:
+                        on_text(task.result())
+                    return task.result()
+            if len(tasks) == 1:
+                # The primary is slow, failed or answered without a script
+                hedge = asyncio.ensure_future(complete_async(prompt, hedge_provider, max_retries=max_retries, use_cache=use_cache))
+                tasks.append(hedge)
+                pending.add(hedge)
+    finally:
+        for task in tasks:
+            task.cancel()
+    for task in tasks:
+        if task.exception() is None:
+            return task.result()
+    raise primary.exception()
+
+
+def generate_text(prompt, max_retries=3, cancel=None, on_wait=None, on_text=None, use_cache=True, timeout=None, provider=None,
+                  model=None, hedge_provider=None):
+    # Blocking entry point for callers on plain threads, e.g. job workers;
+    # cancelling cancels the requests in flight. Past timeout seconds the
+    # requests are cancelled and TimeoutError is raised.
+    coroutine = hedged_complete_async(
+        prompt, provider, hedge_provider, max_retries=max_retries, on_text=on_text, use_cache=use_cache, model=model
+    )
+    return run_coroutine(asyncio.wait_for(coroutine, timeout), cancel, on_wait)
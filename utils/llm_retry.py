@@ -0,0 +1,136 @@
+import asyncio
+import email.utils
+import fcntl
+import json
+import os
+import random
+import time
+
+from utils.file_operations import PROJECT_ROOT
+
+# Retries for LLM calls: only errors that can succeed later are retried, with
+# full-jitter exponential backoff that honours Retry-After, inside a total
+# deadline. Calls also draw from token buckets for requests and tokens per
+# minute, kept in a locked file so every process on the machine shares them
+# and a busy server slows down instead of producing a retry storm.
+LLM_RETRY_DEADLINE_SECONDS = float(os.environ.get("LLM_RETRY_DEADLINE_SECONDS", 300))
+LLM_REQUESTS_PER_MINUTE = float(os.environ.get("LLM_REQUESTS_PER_MINUTE", 500))
+LLM_TOKENS_PER_MINUTE = float(os.environ.get("LLM_TOKENS_PER_MINUTE", 30000))
+# Reserved for the completion until the real length is known
+LLM_COMPLETION_TOKENS_ESTIMATE = int(os.environ.get("LLM_COMPLETION_TOKENS_ESTIMATE", 2000))
+RATE_LIMIT_PATH = os.environ.get("LLM_RATE_LIMIT_PATH", os.path.join(PROJECT_ROOT, "build", "llm_rate_limit.json"))
+BASE_DELAY_SECONDS = 1.0
+MAX_DELAY_SECONDS = 60.0
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+def is_retryable(error):
+    # Throttling, timeouts and server errors; bad requests and auth errors are fatal
+    status = getattr(error, "status_code", None)
+    if not isinstance(status, int):
+        status = getattr(error, "code", None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUS_CODES or status >= 500
+    return isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError))
+
+
+def retry_after_seconds(error):
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, retry_after=None):
+    if retry_after is not None:
+        # Jitter on top so callers told the same time do not return together
+        return retry_after + random.uniform(0, BASE_DELAY_SECONDS)
+    return random.uniform(0, min(MAX_DELAY_SECONDS, BASE_DELAY_SECONDS * 2 ** attempt))
+
+
+async def call_with_retries(call, max_retries=3, retryable=is_retryable, deadline_seconds=LLM_RETRY_DEADLINE_SECONDS):
+    # Awaits call() until it succeeds. Fatal errors, the last attempt's error
+    # and errors whose back-off would pass the deadline are raised.
+    deadline = time.monotonic() + deadline_seconds
+    for attempt in range(max_retries):
+        try:
+            return await call()
+        except Exception as error:
+            if not retryable(error) or attempt == max_retries - 1:
+                raise
+            delay = backoff_delay(attempt, retry_after_seconds(error))
+            if time.monotonic() + delay > deadline:
+                raise
+            print(f"An error occurred: {error}. Retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+def estimate_tokens(*texts):
+    # About four characters per token for English and code
+    return sum(len(text) for text in texts) // 4
+
+
+def _update_buckets(bucket, requests, tokens, force=False):
+    # Takes requests and tokens from the buckets if they are available (or
+    # always, with force) and returns 0, or returns how long to wait before
+    # trying again. A limit of 0 disables that bucket.
+    os.makedirs(os.path.dirname(RATE_LIMIT_PATH), exist_ok=True)
+    with open(RATE_LIMIT_PATH, "a+", encoding="utf-8") as file:
+        fcntl.flock(file, fcntl.LOCK_EX)
+        file.seek(0)
+        try:
+            state = json.loads(file.read() or "{}")
+        except json.JSONDecodeError:
+            state = {}
+        now = time.time()
+        entry = state.get(bucket, {"requests": LLM_REQUESTS_PER_MINUTE, "tokens": LLM_TOKENS_PER_MINUTE, "updated": now})
+        elapsed = now - entry["updated"]
+        entry["requests"] = min(LLM_REQUESTS_PER_MINUTE, entry["requests"] + elapsed * LLM_REQUESTS_PER_MINUTE / 60)
+        entry["tokens"] = min(LLM_TOKENS_PER_MINUTE, entry["tokens"] + elapsed * LLM_TOKENS_PER_MINUTE / 60)
+        entry["updated"] = now
+
+        wait = 0
+        if not force and LLM_REQUESTS_PER_MINUTE > 0:
+            wait = max(wait, (requests - entry["requests"]) * 60 / LLM_REQUESTS_PER_MINUTE)
+        # A request larger than the whole bucket goes through once it is full
+        if not force and LLM_TOKENS_PER_MINUTE > 0:
+            wait = max(wait, (min(tokens, LLM_TOKENS_PER_MINUTE) - entry["tokens"]) * 60 / LLM_TOKENS_PER_MINUTE)
+        if wait <= 0:
+            wait = 0
+            entry["requests"] -= requests
+            entry["tokens"] -= tokens
+        state[bucket] = entry
+        file.seek(0)
+        file.truncate()
+        file.write(json.dumps(state))
+    return wait
+
+
+async def acquire_rate_limit(bucket, tokens):
+    while True:
+        wait = _update_buckets(bucket, 1, tokens)
+        if wait == 0:
+            return
+        await asyncio.sleep(wait)
+
+
+def settle_rate_limit(bucket, tokens):
+    # Charges (or refunds, if negative) the difference between the tokens
+    # reserved up front and the tokens the call actually used
+    _update_buckets(bucket, 0, tokens, force=True)
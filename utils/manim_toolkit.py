@@ -0,0 +1,120 @@
+from manim import *
+
+# Shared building blocks for every scene under scripts/ and for LLM-generated scripts.
+# Import with `from utils.manim_toolkit import *` after `from manim import *`.
+
+CELL_WIDTH = 3
+CELL_HEIGHT = 0.6
+CELL_SCALE = 0.6
+ROW_SPACING = 0.35
+TABLE_LEFT = 4.5
+
+_text_cache = {}
+
+
+def cached_text(text_class, text, scale, **kwargs):
+    # Pango layout and SVG parsing dominate scene construction time. Tables repeat
+    # the same strings over and over, so build each one once and hand out copies.
+    key = (text_class.__name__, text, scale, tuple(sorted((k, str(v)) for k, v in kwargs.items())))
+    if key not in _text_cache:
+        _text_cache[key] = text_class(text, **kwargs).scale(scale)
+    return _text_cache[key].copy()
+
+
+def create_subtitle(text):
+    return cached_text(Text, text, 0.5).to_edge(DOWN, buff=0.4)
+
+
+def create_console(x, y, z, color_fill, code_text):
+    console_rect = Rectangle(width=x, height=y, stroke_width=1, fill_color=color_fill).set_fill(color_fill, 0.5).shift(z)
+    red_arrow_text = cached_text(MarkupText, r'>>> ', 0.45, color=RED_D, opacity=1).next_to(console_rect.get_left(), RIGHT, buff=0.3)
+    code_text = cached_text(Text, code_text, 0.45, color=WHITE, opacity=1).next_to(red_arrow_text, RIGHT, buff=0.1)
+    return VGroup(console_rect, red_arrow_text, code_text)
+
+
+def create_cell(text, fill_color=None, stroke_color=GREY):
+    cell = Rectangle(width=CELL_WIDTH, height=CELL_HEIGHT)
+    if stroke_color is not None:
+        cell.set_stroke(color=stroke_color, opacity=1).scale(CELL_SCALE)
+    else:
+        cell.set_stroke(opacity=0)
+    if fill_color:
+        cell.set_fill(fill_color, opacity=1)
+    text = cached_text(MarkupText, text, 0.4)
+    return VGroup(cell, text)
+
+
+def create_row(texts, y_shift, fill_color=None):
+    row = VGroup()
+    previous_cell = None
+    for text in texts:
+        cell = create_cell(f'<span font_family="monospace">{text}</span>', fill_color)
+        if previous_cell is None:
+            cell.shift(y_shift + TABLE_LEFT * LEFT)
+        else:
+            cell.next_to(previous_cell, RIGHT, buff=0)
+        row.add(cell)
+        previous_cell = cell
+    return row
+
+
+class DataFrameTable(VGroup):
+    # A header row followed by one row per record. Indexing gives rows, indexing a
+    # row gives cells, so `table[0]` is the header and `table[1:]` the data rows.
+    def __init__(self, headers, data, pos_shift, header_fill=GREY_D, **kwargs):
+        rows = [create_row([f'<b>{header}</b>' for header in headers], pos_shift, fill_color=header_fill)]
+        for i, row_data in enumerate(data):
+            rows.append(create_row(row_data, pos_shift - (i + 1) * ROW_SPACING * UP))
+        super().__init__(*rows, **kwargs)
+
+    @property
+    def header(self):
+        return self[0]
+
+    @property
+    def cells(self):
+        return [cell for row in self for cell in row]
+
+
+def create_dataframe(headers, data, pos_shift):
+    return DataFrameTable(headers, data, pos_shift)
+
+
+def create_index_column(indices, data_rows):
+    index_column = []
+    for i, index_value in enumerate(indices):
+        index = cached_text(
+            MarkupText,
+            f'<span font_family="monospace"><b>{index_value}</b></span>',
+            0.45,
+            color=GREY_A,
+            opacity=1
+        )
+        index.next_to(data_rows[i][0].get_left(), LEFT, buff=0.2)
+        index_column.append(index)
+    return index_column
+
+
+def create_index_row(indices, header_row):
+    index_row = []
+    for i, index_value in enumerate(indices):
+        index_cell = create_cell(f'<span font_family="monospace">{index_value}</span>', stroke_color=None)
+        index_cell.move_to(header_row[i].get_center() + ROW_SPACING * UP)
+        index_row.append(index_cell)
+    return index_row
+
+
+def create_highlight(x, y, color):
+    return Rectangle(width=x, height=y).set_stroke(color=color, opacity=1).set_fill(color=color, opacity=0.5).scale(CELL_SCALE)
+
+
+def highlight_rows(rows, columns, color):
+    highlights = []
+    for row in rows:
+        for i in columns:
+            highlight = create_highlight(CELL_WIDTH, CELL_HEIGHT, color).move_to(row[i].get_center())
+            highlights.append(highlight)
+    return highlights
+
+
+highlight_columns = highlight_rows
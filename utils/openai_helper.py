@@ -1,38 +1,74 @@
-from openai import OpenAI
+from openai import APIConnectionError, AsyncOpenAI
 import os
-import time
+from utils.code_blocks import CodeBlockExtractor
+from utils.llm_providers import DEFAULT_MODELS, generate_text
+from utils.llm_retry import (LLM_COMPLETION_TOKENS_ESTIMATE, acquire_rate_limit, estimate_tokens, is_retryable as _is_retryable,
+                             settle_rate_limit)
 import streamlit as st
 
-OPENAI_API_KEY = st.secrets["OPENAI_API_KEY"]
-
-# Load API key from .env file
-#from dotenv import load_dotenv
-#load_dotenv()
-#OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=OPENAI_API_KEY)
-
-def send_message_with_retries(prompt, model="gpt-4o-2024-08-06", max_retries=3):
-    retry_wait = 60
-    for attempt in range(max_retries):
-        try:
-            response = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": (
-                        "You are an expert educator and animator specializing in creating educational videos using Manim. "
-                        "Your task is to generate Python code for Manim that explains a specific data operation step-by-step. "
-                        "Follow the instructions provided in the user prompt carefully, focusing on generating a single resultant DataFrame after demonstrating the original DataFrame. "
-                        "Ensure that the code is well-structured, includes detailed comments, and provides clear explanations with corresponding subtitles. "
-                        "It is crucial that the resultant DataFrame accurately reflects the data operation applied to the original DataFrame. "
-                        "Double-check that all rows meeting the criteria are included and that the resulting data matches the expected output exactly. "
-                        "Voiceovers are not required."
-                    )},
-                    {"role": "user", "content": prompt}
-                ],
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            print(f"An error occurred: {e}")
-            time.sleep(retry_wait)
-            retry_wait *= 2  # Exponential backoff
-    raise Exception("Max retries exceeded")
+DEFAULT_MODEL = DEFAULT_MODELS["openai"]
+
+# Requests from this process share one async client on the background event
+# loop, so retries, repairs and hedged requests reuse its kept-alive
+# connections.
+_client = None
+
+
+def _api_key():
+    # Read on first use, so the app starts without secrets
+    try:
+        api_key = st.secrets["OPENAI_API_KEY"]
+    except (KeyError, FileNotFoundError):
+        # A missing secrets.toml raises FileNotFoundError
+        api_key = os.environ.get("OPENAI_API_KEY")
+    if not api_key:
+        raise RuntimeError("OPENAI_API_KEY is not set in .streamlit/secrets.toml or the environment.")
+    return api_key
+
+
+def _async_client():
+    # Created on the event loop thread, which then owns its connections
+    global _client
+    if _client is None:
+        # Retries are handled by llm_providers, not the SDK
+        _client = AsyncOpenAI(api_key=_api_key(), max_retries=0)
+    return _client
+
+
+def is_retryable(error):
+    return isinstance(error, APIConnectionError) or _is_retryable(error)
+
+
+async def complete(prompt, model, system_message, on_text=None):
+    # One streamed attempt. on_text gets the text so far as tokens arrive, and
+    # the call returns as soon as the first ```python block closes, so the
+    # script can be rendered while the model would still be writing prose.
+    client = _async_client()
+    reserved = estimate_tokens(system_message, prompt) + LLM_COMPLETION_TOKENS_ESTIMATE
+    await acquire_rate_limit("openai", reserved)
+    messages = [
+        {"role": "system", "content": system_message},
+        {"role": "user", "content": prompt}
+    ]
+    stream = await client.chat.completions.create(model=model, messages=messages, stream=True)
+    extractor = CodeBlockExtractor()
+    try:
+        async for chunk in stream:
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            completed = extractor.feed(chunk.choices[0].delta.content)
+            if on_text is not None:
+                on_text(extractor.text)
+            if completed:
+                break
+    finally:
+        # Stops generation of the rest of the response
+        await stream.close()
+    settle_rate_limit("openai", estimate_tokens(system_message, prompt, extractor.text) - reserved)
+    return extractor.text
+
+
+def send_message_with_retries(prompt, model=DEFAULT_MODEL, max_retries=3, cancel=None, on_wait=None, use_cache=True):
+    # Blocking wrapper kept for existing callers; new code should use
+    # llm_providers.generate_text
+    return generate_text(prompt, max_retries, cancel, on_wait, use_cache=use_cache, provider="openai", model=model, hedge_provider="")
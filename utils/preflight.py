@@ -0,0 +1,127 @@
+import ast
+import builtins
+import importlib
+import os
+import time
+
+from utils.generation_jobs import GenerationCancelled
+from utils.render_worker import render_script, run_manim
+from utils.renderer import RenderResult, cache_args, default_limits, estimate_animation_count, find_scenes, profile_flags
+
+# Checks a generated script must pass before its full render, cheapest first,
+# so most broken scripts fail in milliseconds or seconds instead of after a
+# whole render:
+#   static           it parses, has a scene, and every name it reads is bound
+#   construct        manim runs construct() with every animation skipped and
+#                    no frames or files written
+#   first_animation  the opening animations render at preview quality; the
+#                    partial movies go to the render cache for the full render
+PREFLIGHT_TIMEOUT_SECONDS = float(os.environ.get("PREFLIGHT_TIMEOUT_SECONDS", 60))
+# Starting at an animation past the end makes manim skip every animation
+SKIP_ALL_ANIMATIONS = "1000000"
+
+
+def _star_import_names(module_name):
+    # None when the module cannot be inspected
+    try:
+        module = importlib.import_module(module_name)
+    except Exception:
+        return None
+    return set(getattr(module, "__all__", None) or [name for name in dir(module) if not name.startswith("_")])
+
+
+def undefined_names(tree):
+    # Names read anywhere in the module that nothing binds anywhere. Ignores
+    # scopes and ordering, so it only catches names that cannot be defined
+    # at all, such as typos and missing imports.
+    bound = set(dir(builtins)) | {"__file__", "__name__"}
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            bound.add(node.name)
+        elif isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+            bound.add(node.id)
+        elif isinstance(node, ast.arg):
+            bound.add(node.arg)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            bound.add(node.name)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            bound.update(node.names)
+        elif isinstance(node, (ast.MatchAs, ast.MatchStar)) and node.name:
+            bound.add(node.name)
+        elif isinstance(node, ast.MatchMapping) and node.rest:
+            bound.add(node.rest)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                if alias.name != "*":
+                    bound.add((alias.asname or alias.name).split(".")[0])
+                    continue
+                names = _star_import_names(node.module) if isinstance(node, ast.ImportFrom) and node.level == 0 else None
+                if names is None:
+                    return []
+                bound.update(names)
+    names = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load)}
+    return sorted(names - bound)
+
+
+def check_static(script_content):
+    # The error message for a script that fails the static checks, or None
+    try:
+        tree = ast.parse(script_content)
+    except SyntaxError as error:
+        return f"  File \"scene.py\", line {error.lineno}\n    {(error.text or '').strip()}\nSyntaxError: {error.msg}"
+    if not find_scenes(script_content):
+        return "ValueError: the script defines no Scene subclass"
+    names = undefined_names(tree)
+    if names:
+        return "\n".join(f"NameError: name '{name}' is not defined" for name in names)
+    return None
+
+
+def _manim_failed(result):
+    if result.status == "cancelled":
+        raise GenerationCancelled()
+    # Only the exit status counts: the early stages write no full video
+    return result.returncode != 0
+
+
+def preflight(script_content, media_dir, cancel=None, on_queue=None, deadline=None):
+    # Returns the failed stage (or None), the failing result and the time
+    # each stage that ran took. The manim stages share PREFLIGHT_TIMEOUT_SECONDS
+    # and all end by deadline (time.monotonic()).
+    timings = {}
+    started = time.monotonic()
+    error_message = check_static(script_content)
+    timings["static"] = time.monotonic() - started
+    if error_message is not None:
+        return "static", RenderResult(returncode=1, status="failed", wall_time=timings["static"], error_message=error_message,
+                                      script_content=script_content), timings
+
+    preflight_end = time.monotonic() + PREFLIGHT_TIMEOUT_SECONDS
+    limits = default_limits()
+    limits["timeout"] = min(limits["timeout"], PREFLIGHT_TIMEOUT_SECONDS)
+    os.makedirs(media_dir, exist_ok=True)
+    script_path = os.path.join(media_dir, "scene.py")
+    with open(script_path, "w", encoding="utf-8") as file:
+        file.write(script_content)
+    started = time.monotonic()
+    result = run_manim(
+        [*profile_flags("preview"), "--dry_run", "-n", SKIP_ALL_ANIMATIONS, script_path, find_scenes(script_content)[0],
+         *cache_args(media_dir, script_content)], limits=limits, cancel=cancel, on_queue=on_queue, deadline=deadline
+    )
+    timings["construct"] = time.monotonic() - started
+    if _manim_failed(result):
+        result.error_message = result.error_message or result.stderr or f"manim exited with code {result.returncode}"
+        result.script_content = script_content
+        return "construct", result, timings
+
+    # A script this short costs no more to render in full
+    if estimate_animation_count(script_content) > 2:
+        started = time.monotonic()
+        limits["timeout"] = max(preflight_end - started, 0)
+        result = render_script(
+            script_content, media_dir, "first_animation", limits=limits, cancel=cancel, on_queue=on_queue, deadline=deadline
+        )
+        timings["first_animation"] = time.monotonic() - started
+        if _manim_failed(result):
+            return "first_animation", result, timings
+    return None, None, timings
@@ -0,0 +1,121 @@
+import fcntl
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+from utils.file_operations import PROJECT_ROOT
+from utils.generation_jobs import GenerationCancelled
+
+# A machine-wide limit on concurrent manim renders, shared by every process
+# that renders (Streamlit, job workers, batch and shard renders). A slot is an
+# flock on one of RENDER_SLOTS lock files. Waiters queue in FIFO order as
+# locked ticket files; only the head of the queue may take a free slot. Locks
+# are released by the kernel when a process dies, so nothing leaks.
+# Low-priority renders, such as publish renders of generated videos, queue
+# behind every normal waiter and never take the last slot, so previews are not
+# held up behind them.
+SLOTS_DIR = os.environ.get("RENDER_SLOTS_DIR", os.path.join(PROJECT_ROOT, "build", "render_slots"))
+RENDER_SLOTS = int(os.environ.get("RENDER_SLOTS", os.cpu_count() or 1))
+POLL_SECONDS = 0.2
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def _try_lock(path, mode="a"):
+    file = open(path, mode)
+    try:
+        fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        file.close()
+        return None
+    return file
+
+
+def _waiters_ahead(queue_dir, ticket):
+    ahead = 0
+    for name in sorted(os.listdir(queue_dir)):
+        if name >= ticket:
+            break
+        if name.startswith("."):
+            continue
+        path = os.path.join(queue_dir, name)
+        try:
+            stale = _try_lock(path, "r")
+        except FileNotFoundError:
+            # Its waiter just took a slot
+            continue
+        if stale is not None:
+            # Nobody holds the ticket: its waiter either just took a slot or
+            # died without cleaning up
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            stale.close()
+            continue
+        ahead += 1
+    return ahead
+
+
+def _take_free_slot(low_priority=False):
+    for index in range(max(RENDER_SLOTS - 1, 1) if low_priority else RENDER_SLOTS):
+        slot = _try_lock(os.path.join(SLOTS_DIR, f"slot-{index}.lock"))
+        if slot is not None:
+            return slot
+    return None
+
+
+def _enter_queue(queue_dir, low_priority=False):
+    # Tickets sort by priority, then arrival. A ticket is locked before it gets
+    # its visible name, so an unlocked ticket always means a dead waiter.
+    ticket = f"{int(low_priority)}-{time.time_ns():020d}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    hidden_path = os.path.join(queue_dir, f".{ticket}")
+    ticket_file = open(hidden_path, "w")
+    fcntl.flock(ticket_file, fcntl.LOCK_EX)
+    os.rename(hidden_path, os.path.join(queue_dir, ticket))
+    return ticket, ticket_file
+
+
+def _wait_for_slot(cancel, on_queue, low_priority, deadline):
+    queue_dir = os.path.join(SLOTS_DIR, "queue")
+    os.makedirs(queue_dir, exist_ok=True)
+    ticket, ticket_file = _enter_queue(queue_dir, low_priority)
+    position = None
+    try:
+        while True:
+            if cancel is not None and cancel.is_set():
+                raise GenerationCancelled()
+            if deadline is not None and time.monotonic() >= deadline:
+                raise DeadlineExceeded()
+            ahead = _waiters_ahead(queue_dir, ticket)
+            slot = _take_free_slot(low_priority) if ahead == 0 else None
+            if slot is not None:
+                if position is not None and on_queue is not None:
+                    on_queue(None)
+                return slot
+            if ahead + 1 != position:
+                position = ahead + 1
+                if on_queue is not None:
+                    on_queue(position)
+            time.sleep(POLL_SECONDS)
+    finally:
+        try:
+            os.remove(os.path.join(queue_dir, ticket))
+        except FileNotFoundError:
+            pass
+        ticket_file.close()
+
+
+@contextmanager
+def render_slot(cancel=None, on_queue=None, low_priority=False, deadline=None):
+    # Holds one of the machine's render slots for the duration of the block.
+    # on_queue gets the 1-based queue position while waiting, then None.
+    # Raises DeadlineExceeded if no slot is free by deadline (time.monotonic()).
+    slot = _wait_for_slot(cancel, on_queue, low_priority, deadline)
+    try:
+        yield
+    finally:
+        slot.close()
@@ -0,0 +1,326 @@
+import argparse
+import os
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from multiprocessing.connection import Client, Listener
+
+from utils.renderer import (
+    PROJECT_ROOT, RenderResult, apply_limits, cache_args, classify_exit, collect_outputs, default_limits, evict_cache,
+    RENDER_THREAD_ENV, find_scenes, kill_process_group, limit_message, manim_env, parse_progress, profile_extension,
+    profile_flags, save_to_cache,
+)
+from utils.generation_jobs import GenerationCancelled
+from utils.render_slots import DeadlineExceeded, render_slot
+
+# A resident process that has manim, cairo and pango loaded once. Every job
+# runs in a forked child, so renders start warm but cannot leak state into
+# each other or take the worker down.
+SOCKET_PATH = os.environ.get("RENDER_WORKER_SOCKET", os.path.join(PROJECT_ROOT, "build", "render_worker.sock"))
+POLL_SECONDS = 0.2
+
+
+def _warm_up():
+    import manim.__main__  # noqa: F401
+    import utils.manim_toolkit  # noqa: F401
+    from manim import Text, tempconfig
+
+    # Building one text mobject initialises pango and fontconfig in the parent
+    with tempfile.TemporaryDirectory() as text_dir:
+        with tempconfig({"text_dir": text_dir}):
+            Text("warm up")
+
+
+def _start_child(args, cwd, stdout_path, stderr_path, limits):
+    from manim.__main__ import main as manim_main
+
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            os.setpgid(0, 0)
+            apply_limits(limits)
+            os.chdir(cwd)
+            os.dup2(os.open(stdout_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC), 1)
+            os.dup2(os.open(stderr_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC), 2)
+            try:
+                manim_main(args=args, prog_name="manim")
+                code = 0
+            except SystemExit as exit:
+                code = exit.code if isinstance(exit.code, int) else (0 if exit.code is None else 1)
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+    return pid
+
+
+def _read_log(path):
+    with open(path, "r", encoding="utf-8", errors="replace") as file:
+        return file.read()
+
+
+def _supervise(pid, log_paths, limits, on_progress=None, cancel=None):
+    # Waits for the render in its own process group while tailing its logs:
+    # progress lines go to on_progress, and the group is killed if the render
+    # runs past the timeout, stops writing output or cancel is set. Runs on
+    # the caller's thread so callbacks can touch Streamlit elements.
+    start = time.monotonic()
+    last_output = start
+    offsets = dict.fromkeys(log_paths, 0)
+    pending = dict.fromkeys(log_paths, b"")
+    stopped = None
+    exited = 0
+    try:
+        while True:
+            # wait4 rather than wait, to get this render's own resource usage
+            exited, status, usage = os.wait4(pid, os.WNOHANG)
+            for path in log_paths:
+                with open(path, "rb") as file:
+                    file.seek(offsets[path])
+                    data = file.read()
+                if not data:
+                    continue
+                offsets[path] += len(data)
+                last_output = time.monotonic()
+                # Progress bars redraw with carriage returns
+                lines = re.split(rb"[\r\n]", pending[path] + data)
+                pending[path] = lines.pop()
+                for line in lines:
+                    progress = parse_progress(line.decode("utf-8", errors="replace"))
+                    if progress is not None and on_progress is not None:
+                        on_progress({**progress, "elapsed": time.monotonic() - start})
+            if exited:
+                break
+            now = time.monotonic()
+            if stopped is None and cancel is not None and cancel.is_set():
+                stopped = "cancelled"
+                kill_process_group(pid)
+            elif stopped is None and now - start > limits["timeout"]:
+                stopped = "timeout"
+                kill_process_group(pid)
+            elif stopped is None and now - last_output > limits["stall_seconds"]:
+                stopped = "stalled"
+                kill_process_group(pid)
+            time.sleep(POLL_SECONDS)
+    finally:
+        # Take down anything the render started that is still running, also
+        # when a progress callback raised
+        kill_process_group(pid)
+        if not exited:
+            os.waitpid(pid, 0)
+    stdout, stderr = (_read_log(path) for path in log_paths)
+    return os.waitstatus_to_exitcode(status), stdout, stderr, usage.ru_maxrss, stopped
+
+
+def _watch_for_cancel(connection, cancel):
+    # Any message from the client, or the client going away, cancels the render
+    try:
+        connection.recv()
+    except (EOFError, OSError):
+        pass
+    cancel.set()
+
+
+def _handle(connection):
+    job = connection.recv()
+    limits = job.get("limits") or default_limits()
+    with tempfile.TemporaryDirectory() as log_dir:
+        log_paths = [os.path.join(log_dir, "stdout.log"), os.path.join(log_dir, "stderr.log")]
+        for path in log_paths:
+            open(path, "w").close()
+        pid = _start_child(job["args"], job.get("cwd", PROJECT_ROOT), *log_paths, limits)
+        on_progress = (lambda progress: connection.send({"progress": progress})) if job.get("progress") else None
+        cancel = threading.Event()
+        threading.Thread(target=_watch_for_cancel, args=(connection, cancel), daemon=True).start()
+        try:
+            returncode, stdout, stderr, peak_memory_kb, stopped = _supervise(pid, log_paths, limits, on_progress, cancel)
+        except OSError:
+            # The client went away while progress was being sent
+            return
+    try:
+        connection.send({
+            "returncode": returncode,
+            "stdout": stdout,
+            "stderr": stderr,
+            "peak_memory_kb": peak_memory_kb,
+            "stopped": stopped,
+        })
+    except OSError:
+        pass
+
+
+def serve(address=SOCKET_PATH):
+    sys.path.insert(0, PROJECT_ROOT)
+    _warm_up()
+
+    os.makedirs(os.path.dirname(address), exist_ok=True)
+    if os.path.exists(address):
+        os.remove(address)
+    listener = Listener(address, family="AF_UNIX")
+    os.chmod(address, 0o600)
+    # Handler processes are reaped automatically
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    print(f"Render worker ready on {address}", flush=True)
+
+    try:
+        while True:
+            connection = listener.accept()
+            if os.fork() == 0:
+                signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+                listener.close()
+                try:
+                    _handle(connection)
+                finally:
+                    connection.close()
+                    os._exit(0)
+            connection.close()
+    finally:
+        listener.close()
+
+
+def submit(args, cwd=None, address=SOCKET_PATH, limits=None, on_progress=None, cancel=None):
+    cwd = cwd or os.getcwd()
+    limits = limits or default_limits()
+    deadline = time.monotonic() + limits["timeout"] + 60
+    cancel_sent = False
+    with Client(address, family="AF_UNIX") as connection:
+        connection.send({"args": list(args), "cwd": cwd, "limits": limits, "progress": on_progress is not None})
+        while True:
+            if cancel is not None and cancel.is_set() and not cancel_sent:
+                # The worker kills the render and still sends its final response
+                connection.send({"cancel": True})
+                cancel_sent = True
+            # The worker enforces the limits; this only guards against a stuck worker
+            if time.monotonic() > deadline:
+                return {"returncode": -signal.SIGKILL, "stdout": "", "stderr": "", "peak_memory_kb": 0, "stopped": "timeout"}
+            if not connection.poll(POLL_SECONDS):
+                continue
+            message = connection.recv()
+            if "progress" not in message:
+                return message
+            on_progress(message["progress"])
+
+
+def _run_subprocess(args, cwd, limits, on_progress=None, cancel=None):
+    with tempfile.TemporaryDirectory() as log_dir:
+        log_paths = [os.path.join(log_dir, "stdout.log"), os.path.join(log_dir, "stderr.log")]
+        with open(log_paths[0], "wb") as stdout, open(log_paths[1], "wb") as stderr:
+            process = subprocess.Popen(
+                ["manim", *args], stdout=stdout, stderr=stderr, env=manim_env(), cwd=cwd, start_new_session=True
+            )
+        # prlimit from the parent rather than preexec_fn, which is unsafe in threaded callers like Streamlit
+        try:
+            apply_limits(limits, process.pid)
+        except ProcessLookupError:
+            pass
+        result = _supervise(process.pid, log_paths, limits, on_progress, cancel)
+    process.returncode = result[0]
+    return result
+
+
+def run_manim(args, cwd=None, limits=None, on_progress=None, cancel=None, on_queue=None, low_priority=False, deadline=None):
+    # Runs `manim <args>`, on the warm worker when one is running, and returns
+    # a RenderResult with the exit status, logs, wall time and peak memory.
+    # Renders that exceed the wall-clock, CPU or memory limits, or stall, are
+    # killed together with their process group and reported with a limit
+    # status. on_progress receives {"animation", "percent", "elapsed"} dicts;
+    # setting the cancel event kills the render the same way. The render first
+    # waits for a machine-wide render slot, reporting its place to on_queue;
+    # low_priority renders let every other waiting render go first. Waiting
+    # and rendering together end by deadline (time.monotonic()), with the
+    # "deadline" status.
+    cwd = cwd or os.getcwd()
+    limits = limits or default_limits()
+    queue_start = time.perf_counter()
+    response = None
+    stopped_by_deadline = False
+    try:
+        with render_slot(cancel, on_queue, low_priority, deadline):
+            start = time.perf_counter()
+            if deadline is not None and deadline - time.monotonic() < limits["timeout"]:
+                limits = {**limits, "timeout": max(deadline - time.monotonic(), 0)}
+                stopped_by_deadline = True
+            if os.path.exists(SOCKET_PATH):
+                try:
+                    response = submit(args, cwd, limits=limits, on_progress=on_progress, cancel=cancel)
+                except (ConnectionRefusedError, FileNotFoundError, EOFError):
+                    start = time.perf_counter()
+            if response is None:
+                returncode, stdout, stderr, peak_memory_kb, stopped = _run_subprocess(args, cwd, limits, on_progress, cancel)
+                response = {
+                    "returncode": returncode,
+                    "stdout": stdout,
+                    "stderr": stderr,
+                    "peak_memory_kb": peak_memory_kb,
+                    "stopped": stopped,
+                }
+    except GenerationCancelled:
+        # Cancelled while waiting for a slot
+        start = time.perf_counter()
+        response = {"returncode": -signal.SIGTERM, "stdout": "", "stderr": "", "peak_memory_kb": 0, "stopped": "cancelled"}
+    except DeadlineExceeded:
+        start = time.perf_counter()
+        response = {"returncode": -signal.SIGTERM, "stdout": "", "stderr": "", "peak_memory_kb": 0, "stopped": "deadline"}
+    if stopped_by_deadline and response["stopped"] == "timeout":
+        response["stopped"] = "deadline"
+
+    status = classify_exit(response["returncode"], response["stderr"], response["stopped"])
+    return RenderResult(
+        returncode=response["returncode"],
+        status=status,
+        stdout=response["stdout"],
+        stderr=response["stderr"],
+        wall_time=time.perf_counter() - start,
+        queue_time=start - queue_start,
+        peak_memory_kb=response["peak_memory_kb"],
+        error_message=limit_message(status, limits),
+    )
+
+
+def render_script(
+    script_content, media_dir, profile="preview", output_path=None, limits=None, on_progress=None, cancel=None, on_queue=None,
+    low_priority=False, deadline=None
+):
+    # One render of script_content with the shared cache, its output moved to
+    # output_path (default <media_dir>/<profile>.mp4).
+    os.makedirs(media_dir, exist_ok=True)
+    script_path = os.path.join(media_dir, "scene.py")
+    with open(script_path, "w", encoding="utf-8") as file:
+        file.write(script_content)
+    scene_names = find_scenes(script_content)[:1]
+    extension = profile_extension(profile)
+    output_path = output_path or os.path.join(media_dir, f"{profile}.{extension}")
+
+    result = run_manim(
+        [*profile_flags(profile), script_path, *scene_names, *cache_args(media_dir, script_content)], limits=limits,
+        on_progress=on_progress, cancel=cancel, on_queue=on_queue, low_priority=low_priority, deadline=deadline
+    )
+    save_to_cache(media_dir)
+    evict_cache()
+    collect_outputs(result, media_dir, scene_names[0] if scene_names else None, output_path, extension)
+    result.script_content = script_content
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Keep manim loaded and render scene scripts sent over a local socket.")
+    parser.add_argument("--socket", default=SOCKET_PATH, help="Unix socket to listen on")
+    args = parser.parse_args(argv)
+    if any(name not in os.environ for name in RENDER_THREAD_ENV):
+        # Thread counts and malloc arenas are read at start-up, and forked
+        # renders inherit them, so restart the worker with them pinned
+        os.execve(sys.executable, [sys.executable, "-m", "utils.render_worker", "--socket", args.socket], manim_env())
+    serve(args.socket)
+
+
+if __name__ == "__main__":
+    main()
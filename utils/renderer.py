@@ -0,0 +1,370 @@
+import ast
+import glob
+import json
+import os
+import re
+import resource
+import shutil
+import signal
+import subprocess
+from dataclasses import asdict, dataclass
+
+# PROJECT_ROOT goes on rendered scripts' path, so they can
+# `from utils.manim_toolkit import *`
+from utils.file_operations import PROJECT_ROOT, copy_file_atomic
+
+# Partial movie files and text SVGs are content-addressed by manim, so a single
+# cache shared by every render lets repair attempts reuse unchanged animations.
+CACHE_DIR = os.environ.get("MANIM_CACHE_DIR", os.path.join(PROJECT_ROOT, ".manim_cache"))
+CACHE_MAX_BYTES = int(os.environ.get("MANIM_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+
+
+# Every render runs in its own process group under these limits, so a generated
+# script with a runaway loop or an enormous table cannot hold a core or the
+# host's memory indefinitely.
+RENDER_TIMEOUT_SECONDS = float(os.environ.get("RENDER_TIMEOUT_SECONDS", 300))
+RENDER_CPU_SECONDS = int(os.environ.get("RENDER_CPU_SECONDS", 600))
+RENDER_MEMORY_MB = int(os.environ.get("RENDER_MEMORY_MB", 4096))
+# A render that writes nothing to its logs for this long is considered hung
+RENDER_STALL_SECONDS = float(os.environ.get("RENDER_STALL_SECONDS", 120))
+# The memory limit is on address space, which numpy's BLAS threads and glibc's
+# per-thread malloc arenas inflate on many-core hosts without using the
+# memory. A render needs neither, so they are pinned unless already set.
+RENDER_THREAD_ENV = {"OPENBLAS_NUM_THREADS": "1", "OMP_NUM_THREADS": "1", "MKL_NUM_THREADS": "1", "MALLOC_ARENA_MAX": "2"}
+
+LIMIT_MESSAGES = {
+    "timeout": "The render was stopped after {timeout:.0f} seconds. The script is too slow: reduce the number of animations, rows or loop iterations.",
+    "cpu_limit": "The render used more than {cpu_seconds} seconds of CPU time. The script is too slow: reduce the number of animations, rows or loop iterations.",
+    "out_of_memory": "The render ran out of memory (limit {memory_mb} MB). The script builds too many or too large objects.",
+    "stalled": "The render produced no output for {stall_seconds:.0f} seconds and was stopped. The script is probably stuck in a loop.",
+    "cancelled": "The render was cancelled.",
+    "deadline": "The time budget for this video ran out before the render finished.",
+}
+
+# manim's per-animation progress bar, e.g. "Animation 3: FadeIn(VGroup):  45%|####   | 7/15"
+PROGRESS_PATTERN = re.compile(r"Animation (\d+)\s*:.*?(\d+)%")
+
+# Named render settings for a headless server: none of them pass -p, which
+# would make manim try to open a media player after every render.
+RENDER_PROFILES = {
+    # 854x480 at 15 fps, for the interactive generator
+    "preview": {"flags": ["-ql"], "extension": "mp4"},
+    # 1920x1080 at 60 fps, for the videos/ catalogue
+    "publish": {"flags": ["-qh"], "extension": "mp4"},
+    # Only the last frame, as a PNG
+    "thumbnail": {"flags": ["-qm", "--save_last_frame"], "extension": "png"},
+    # Only the opening animations at preview quality, to check a script
+    "first_animation": {"flags": ["-ql", "-n", "0,1"], "extension": "mp4"},
+}
+
+
+def profile_flags(profile):
+    if profile not in RENDER_PROFILES:
+        raise ValueError(f"Unknown render profile '{profile}', expected one of {', '.join(RENDER_PROFILES)}")
+    return list(RENDER_PROFILES[profile]["flags"])
+
+
+def profile_extension(profile):
+    return RENDER_PROFILES[profile]["extension"]
+
+
+@dataclass
+class RenderResult:
+    returncode: int
+    # "ok", "failed", or a resource-limit status from LIMIT_MESSAGES
+    status: str = "ok"
+    stdout: str = ""
+    stderr: str = ""
+    wall_time: float = 0.0
+    # Time spent waiting for a machine-wide render slot
+    queue_time: float = 0.0
+    # Peak resident set size of the render process, in kilobytes
+    peak_memory_kb: int = 0
+    video_path: str = None
+    partial_movie_count: int = 0
+    frame_count: int = 0
+    duration: float = 0.0
+    error_message: str = None
+    script_content: str = None
+
+    @property
+    def ok(self):
+        return self.status == "ok" and self.video_path is not None
+
+    def as_dict(self, with_logs=False):
+        data = asdict(self)
+        if not with_logs:
+            for key in ("stdout", "stderr", "script_content"):
+                data.pop(key)
+        return data
+
+
+def default_limits():
+    return {
+        "timeout": RENDER_TIMEOUT_SECONDS,
+        "cpu_seconds": RENDER_CPU_SECONDS,
+        "memory_mb": RENDER_MEMORY_MB,
+        "stall_seconds": RENDER_STALL_SECONDS,
+    }
+
+
+def apply_limits(limits, pid=0):
+    # pid 0 is the calling process
+    cpu_seconds = limits["cpu_seconds"]
+    memory_bytes = limits["memory_mb"] * 1024 * 1024
+    resource.prlimit(pid, resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 5))
+    resource.prlimit(pid, resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+
+
+def kill_process_group(pgid):
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def limit_message(status, limits):
+    if status not in LIMIT_MESSAGES:
+        return None
+    return LIMIT_MESSAGES[status].format(**limits)
+
+
+def classify_exit(returncode, stderr, stopped):
+    # stopped is "timeout", "stalled", "cancelled" or "deadline" when the render was stopped
+    if returncode == 0:
+        return "ok"
+    if stopped:
+        return stopped
+    if returncode == -signal.SIGXCPU:
+        return "cpu_limit"
+    if any(marker in stderr for marker in ("MemoryError", "bad_alloc", "Cannot allocate memory")):
+        return "out_of_memory"
+    return "failed"
+
+
+def manim_env():
+    env = os.environ.copy()
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [PROJECT_ROOT, env.get("PYTHONPATH")]))
+    # Logs are streamed while the render runs
+    env["PYTHONUNBUFFERED"] = "1"
+    for name, value in RENDER_THREAD_ENV.items():
+        env.setdefault(name, value)
+    return env
+
+
+def parse_progress(line):
+    match = PROGRESS_PATTERN.search(line)
+    if match is None:
+        return None
+    return {"animation": int(match.group(1)), "percent": int(match.group(2))}
+
+
+def _static_length(node):
+    # Iteration count of a for loop over a literal sequence or range(constant...)
+    if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+        return len(node.elts)
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == "range":
+        values = [arg.value for arg in node.args if isinstance(arg, ast.Constant) and isinstance(arg.value, int)]
+        if len(values) == len(node.args):
+            return len(range(*values))
+    return 1
+
+
+def estimate_animation_count(script_content):
+    # Counts self.play/self.wait calls, multiplied through loops over literal
+    # sequences. Only an estimate, used to turn per-animation progress into ETA.
+    try:
+        tree = ast.parse(script_content)
+    except SyntaxError:
+        return 0
+
+    def count(node, multiplier):
+        total = 0
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr in ("play", "wait"):
+            if isinstance(node.func.value, ast.Name) and node.func.value.id == "self":
+                total += multiplier
+        if isinstance(node, (ast.For, ast.AsyncFor)):
+            inner = multiplier * _static_length(node.iter)
+            return total + sum(count(child, inner) for child in node.body) + sum(count(child, multiplier) for child in node.orelse)
+        return total + sum(count(child, multiplier) for child in ast.iter_child_nodes(node))
+
+    return count(tree, 1)
+
+
+def progress_estimate(progress, expected_animations):
+    # (fraction done, seconds remaining or None) from a progress event
+    expected = max(expected_animations, progress["animation"] + 1)
+    fraction = min((progress["animation"] + progress["percent"] / 100) / expected, 1.0)
+    if fraction <= 0:
+        return fraction, None
+    return fraction, progress["elapsed"] * (1 - fraction) / fraction
+
+
+def find_scenes(script_content):
+    try:
+        tree = ast.parse(script_content)
+    except SyntaxError:
+        return []
+    scenes = []
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef):
+            base_names = [base.id if isinstance(base, ast.Name) else getattr(base, "attr", "") for base in node.bases]
+            if any(name.endswith("Scene") for name in base_names):
+                scenes.append(node.name)
+    return scenes
+
+
+def find_rendered_output(media_dir, scene_name, extension="mp4"):
+    # manim writes <media_dir>/videos/<script>/<quality>/<Scene>.mp4 next to a
+    # partial_movie_files directory that must not be picked up, and last frames
+    # to <media_dir>/images/<script>/<Scene>.png.
+    if extension == "mp4":
+        pattern = os.path.join(media_dir, "videos", "**", f"{scene_name}.mp4")
+    else:
+        pattern = os.path.join(media_dir, "images", "**", f"{scene_name}*.{extension}")
+    matches = [path for path in glob.glob(pattern, recursive=True) if "partial_movie_files" not in path]
+    return max(matches, key=os.path.getmtime) if matches else None
+
+
+def _cache_locations(media_dir, scene_names, cache_dir):
+    # (directory inside the render's media_dir, directory inside the cache)
+    locations = [
+        (os.path.join(media_dir, "texts"), os.path.join(cache_dir, "texts")),
+        (os.path.join(media_dir, "Tex"), os.path.join(cache_dir, "Tex")),
+    ]
+    for scene_name in scene_names:
+        locations.append((
+            os.path.join(media_dir, "partial_movie_files", scene_name),
+            os.path.join(cache_dir, "partial_movie_files", scene_name),
+        ))
+    return locations
+
+
+def _link_files(source_dir, target_dir):
+    if not os.path.isdir(source_dir):
+        return
+    os.makedirs(target_dir, exist_ok=True)
+    for name in os.listdir(source_dir):
+        source = os.path.join(source_dir, name)
+        target = os.path.join(target_dir, name)
+        if name.endswith(".txt") or not os.path.isfile(source) or os.path.exists(target):
+            continue
+        try:
+            os.link(source, target)
+        except FileExistsError:
+            pass
+        except OSError:
+            # Different filesystem
+            copy_file_atomic(source, target)
+
+
+def write_cache_config(media_dir):
+    # manim only exposes partial_movie_dir through a config file. Each render
+    # keeps its own working directories and shares files with the cache through
+    # hard links, so concurrent renders never see each other's half-written files.
+    config_path = os.path.join(media_dir, "manim.cfg")
+    with open(config_path, "w", encoding="utf-8") as file:
+        file.write("[CLI]\n")
+        file.write(f"partial_movie_dir = {os.path.join(media_dir, 'partial_movie_files', '{scene_name}')}\n")
+        # Eviction is handled by evict_cache, by size rather than file count
+        file.write("max_files_cached = -1\n")
+    return config_path
+
+
+def restore_from_cache(media_dir, scene_names, cache_dir=CACHE_DIR):
+    for render_dir, cached_dir in _cache_locations(media_dir, scene_names, cache_dir):
+        _link_files(cached_dir, render_dir)
+
+
+def save_to_cache(media_dir, cache_dir=CACHE_DIR):
+    partial_root = os.path.join(media_dir, "partial_movie_files")
+    scene_names = os.listdir(partial_root) if os.path.isdir(partial_root) else []
+    for render_dir, cached_dir in _cache_locations(media_dir, scene_names, cache_dir):
+        _link_files(render_dir, cached_dir)
+
+
+def cache_args(media_dir, script_content, cache_dir=CACHE_DIR):
+    os.makedirs(media_dir, exist_ok=True)
+    restore_from_cache(media_dir, find_scenes(script_content), cache_dir)
+    return ["--media_dir", media_dir, "--config_file", write_cache_config(media_dir)]
+
+
+def evict_cache(cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+    entries = []
+    total = 0
+    for root, dirs, files in os.walk(cache_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((max(stat.st_atime, stat.st_mtime), stat.st_size, path))
+            total += stat.st_size
+
+    removed = 0
+    for last_used, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        total -= size
+        removed += 1
+    return removed
+
+
+def probe_video(video_path):
+    # (frame count, duration in seconds), or zeros when ffprobe is unavailable
+    try:
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "stream=nb_frames,duration",
+             "-of", "json", video_path],
+            capture_output=True, text=True
+        )
+        stream = json.loads(result.stdout)["streams"][0]
+        return int(stream.get("nb_frames", 0)), float(stream.get("duration", 0.0))
+    except (OSError, ValueError, KeyError, IndexError):
+        return 0, 0.0
+
+
+def count_partial_movies(media_dir, scene_name):
+    # manim lists the partial movies it concatenated in partial_movie_file_list.txt
+    partial_dir = os.path.join(media_dir, "partial_movie_files", scene_name)
+    file_list = os.path.join(partial_dir, "partial_movie_file_list.txt")
+    if os.path.exists(file_list):
+        with open(file_list, "r", encoding="utf-8") as file:
+            return sum(1 for line in file if line.startswith("file "))
+    if os.path.isdir(partial_dir):
+        return sum(1 for name in os.listdir(partial_dir) if name.endswith(".mp4"))
+    return 0
+
+
+def collect_outputs(result, media_dir, scene_name, output_path=None, extension="mp4"):
+    # Fill in the output fields of a finished render and move the video to a
+    # deterministic output_path, so callers never have to search media_dir.
+    if result.returncode != 0:
+        result.error_message = result.error_message or result.stderr or f"manim exited with code {result.returncode}"
+        return result
+
+    rendered = find_rendered_output(media_dir, scene_name, extension) if scene_name else None
+    if rendered is None:
+        result.status = "failed"
+        result.error_message = "manim finished but no output was written"
+        return result
+    if output_path is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        shutil.move(rendered, output_path)
+        rendered = output_path
+
+    result.video_path = rendered
+    if extension == "mp4":
+        result.partial_movie_count = count_partial_movies(media_dir, scene_name)
+        result.frame_count, result.duration = probe_video(rendered)
+    return result
+
+
+def write_render_log(result, path):
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(result.as_dict(), file, indent=2)
@@ -0,0 +1,125 @@
+import json
+import os
+import re
+import time
+
+from utils.file_operations import ensure_directory_exists, extract_code_blocks
+from utils.generation_jobs import GenerationCancelled
+from utils.llm_providers import generate_text
+from utils.llm_retry import LLM_COMPLETION_TOKENS_ESTIMATE, estimate_tokens
+from utils.preflight import preflight
+from utils.render_worker import render_script
+from utils.renderer import write_render_log
+
+# Renders a generated script and, while it fails, asks the LLM to repair it,
+# within one budget per generation: at most REPAIR_MAX_RENDERS attempts that
+# run manim, REPAIR_MAX_SECONDS of wall-clock and REPAIR_MAX_TOKENS LLM tokens
+# (both counting the answer that produced the script). Each attempt first runs
+# the preflight checks and only renders in full if they pass. It also stops early when a repair
+# brings back the error it was meant to fix. Each attempt is recorded with
+# its timings and token cost in repair.json next to the video.
+REPAIR_MAX_RENDERS = int(os.environ.get("REPAIR_MAX_RENDERS", 4))
+REPAIR_MAX_SECONDS = float(os.environ.get("REPAIR_MAX_SECONDS", 600))
+REPAIR_MAX_TOKENS = int(os.environ.get("REPAIR_MAX_TOKENS", 40000))
+# Only the end of a long traceback goes into the repair prompt
+REPAIR_ERROR_CHARS = 4000
+
+
+def error_signature(error_message):
+    # The last line of the error, usually "SomeError: message", without the
+    # paths, numbers and box drawing that vary between runs
+    lines = [line.strip("│╭╮╰╯─ \t") for line in (error_message or "").splitlines()]
+    lines = [line for line in lines if line]
+    if not lines:
+        return ""
+    signature = re.sub(r"(?:/[\w.\-]+)+/", "", lines[-1])
+    return re.sub(r"\d+", "N", signature)
+
+
+def repair_prompt(script_content, error_message):
+    error_message = (error_message or "")[-REPAIR_ERROR_CHARS:]
+    return f"The following Manim script failed with an error:\n\n{script_content}\n\nError:\n{error_message}\n\nPlease debug and provide a corrected version of the script."
+
+
+def _stop_reason(report, signatures, max_renders, max_seconds, max_tokens, prompt):
+    if report["renders"] >= max_renders:
+        return f"render budget of {max_renders} used"
+    if time.monotonic() - report["started"] >= max_seconds:
+        return f"time budget of {max_seconds:.0f}s used"
+    if len(signatures) >= 2 and signatures[-1] == signatures[-2]:
+        return "the repair did not change the error"
+    if report["tokens"] + estimate_tokens(prompt) + LLM_COMPLETION_TOKENS_ESTIMATE > max_tokens:
+        return f"token budget of {max_tokens} used"
+    return None
+
+
+def render_with_repairs(script_content, output_dir, profile="preview", tokens_used=0, on_progress=None, cancel=None, on_queue=None,
+                        on_attempt=None, use_cache=True, max_renders=REPAIR_MAX_RENDERS, max_seconds=REPAIR_MAX_SECONDS,
+                        max_tokens=REPAIR_MAX_TOKENS, started=None):
+    # Returns the last render result and the report. on_attempt gets the
+    # attempts so far and the current script after every render and repair.
+    # started is the time.monotonic() the generation began, if earlier.
+    ensure_directory_exists(output_dir)
+    report = {"started": started or time.monotonic(), "renders": 0, "tokens": tokens_used, "stop_reason": None, "attempts": []}
+    signatures = []
+    # Waiting for render slots and rendering stop here too, not just repairs
+    deadline = report["started"] + max_seconds
+    while True:
+        stage, result, timings = preflight(script_content, os.path.join(output_dir, "preflight"), cancel, on_queue, deadline)
+        if stage is None:
+            stage = "render"
+            result = render_script(
+                script_content, output_dir, profile, on_progress=on_progress, cancel=cancel, on_queue=on_queue, deadline=deadline
+            )
+            if result.status == "cancelled":
+                raise GenerationCancelled()
+        # A script that fails the static checks never reached manim
+        if stage != "static":
+            report["renders"] += 1
+        signatures.append(error_signature(result.error_message) if not result.ok else None)
+        attempt = {
+            "attempt": len(report["attempts"]) + 1, "stage": stage, "status": result.status, "error": result.error_message,
+            "error_signature": signatures[-1], "preflight_seconds": timings,
+            "render_seconds": result.wall_time if stage == "render" else None, "queue_seconds": result.queue_time,
+            "repair_seconds": None, "repair_tokens": None, "stdout": result.stdout, "stderr": result.stderr,
+        }
+        report["attempts"].append(attempt)
+        if on_attempt is not None:
+            on_attempt(report["attempts"], script_content)
+        if result.ok:
+            break
+        if result.status == "deadline":
+            report["stop_reason"] = f"time budget of {max_seconds:.0f}s used"
+            break
+
+        prompt = repair_prompt(script_content, result.error_message)
+        report["stop_reason"] = _stop_reason(report, signatures, max_renders, max_seconds, max_tokens, prompt)
+        if report["stop_reason"] is not None:
+            break
+        repair_started = time.monotonic()
+        try:
+            response_text = generate_text(
+                prompt, cancel=cancel, use_cache=use_cache, timeout=max_seconds - (repair_started - report["started"])
+            )
+        except TimeoutError:
+            report["stop_reason"] = f"time budget of {max_seconds:.0f}s used"
+            break
+        attempt["repair_seconds"] = time.monotonic() - repair_started
+        attempt["repair_tokens"] = estimate_tokens(prompt, response_text)
+        report["tokens"] += attempt["repair_tokens"]
+        corrected_code_blocks = extract_code_blocks(response_text)
+        if not corrected_code_blocks:
+            report["stop_reason"] = "the repair answer had no script"
+            break
+        script_content = corrected_code_blocks[0].strip()
+        if on_attempt is not None:
+            on_attempt(report["attempts"], script_content)
+
+    report["seconds"] = time.monotonic() - report.pop("started")
+    write_render_log(result, os.path.join(output_dir, "render.json"))
+    # The logs are in render.json; repair.json keeps the telemetry
+    telemetry = {**report, "attempts": [{key: value for key, value in attempt.items() if key not in ("stdout", "stderr")}
+                                        for attempt in report["attempts"]]}
+    with open(os.path.join(output_dir, "repair.json"), "w", encoding="utf-8") as file:
+        json.dump(telemetry, file, indent=2)
+    return result, report
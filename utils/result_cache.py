@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from utils.file_operations import PROJECT_ROOT, copy_file_atomic, write_json_atomic
+
+# Finished generations, keyed like job_queue requests by operation, prompt
+# version, model and render profile, so asking again is answered without an
+# LLM call or a render. Entries older than RESULT_CACHE_MAX_AGE_DAYS are
+# dropped, then the least recently used until the cache fits its size budget.
+# The cache owns its videos: they are moved in, so evicting an entry frees its
+# space.
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", os.path.join(PROJECT_ROOT, "generated_videos", "results"))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 1024 ** 3))
+RESULT_CACHE_MAX_AGE_DAYS = float(os.environ.get("RESULT_CACHE_MAX_AGE_DAYS", 30))
+
+
+def key_digest(key):
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def _entry_dir(key, cache_dir):
+    return os.path.join(cache_dir, key_digest(key))
+
+
+def _read_entry(entry_dir):
+    try:
+        with open(os.path.join(entry_dir, "result.json"), "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _move_video(source, target):
+    try:
+        os.replace(source, target)
+    except OSError:
+        # Different filesystem
+        copy_file_atomic(source, target)
+        os.remove(source)
+
+
+def _dir_size(path):
+    total = 0
+    for name in os.listdir(path):
+        try:
+            total += os.path.getsize(os.path.join(path, name))
+        except FileNotFoundError:
+            pass
+    return total
+
+
+def lookup_result(key, cache_dir=RESULT_CACHE_DIR, max_age_days=RESULT_CACHE_MAX_AGE_DAYS):
+    # The cached result for key with absolute video paths, or None
+    entry_dir = _entry_dir(key, cache_dir)
+    entry = _read_entry(entry_dir)
+    if entry is None or time.time() - entry["created"] > max_age_days * 86400:
+        return None
+    # An entry is only usable with the video of the profile it is keyed by
+    if key["profile"] not in entry["videos"]:
+        return None
+    videos = {name: os.path.join(entry_dir, file_name) for name, file_name in entry["videos"].items()}
+    if not all(os.path.exists(path) for path in videos.values()):
+        return None
+    # Eviction is least recently used first
+    os.utime(os.path.join(entry_dir, "result.json"))
+    return {**entry, "videos": videos}
+
+
+def store_result(key, script_content, response_text, videos, cache_dir=RESULT_CACHE_DIR):
+    # videos maps a profile name to a rendered file, which is moved into the
+    # cache; returns the new paths. Storing again for the same key adds
+    # videos, e.g. the publish render after the preview. Other videos without
+    # the key's own profile video for the same script, e.g. a publish render
+    # finishing after its entry was evicted or regenerated, are dropped.
+    entry_dir = _entry_dir(key, cache_dir)
+    entry = _read_entry(entry_dir)
+    if key["profile"] not in videos and (entry is None or entry["script_content"] != script_content):
+        for path in videos.values():
+            os.remove(path)
+        return {}
+    os.makedirs(entry_dir, exist_ok=True)
+    if entry is None or entry["script_content"] != script_content:
+        # Videos of another script for the same key are stale
+        for file_name in (entry or {}).get("videos", {}).values():
+            try:
+                os.remove(os.path.join(entry_dir, file_name))
+            except FileNotFoundError:
+                pass
+        entry = {"key": key, "created": time.time(), "script_content": script_content, "response_text": response_text, "videos": {}}
+    stored = {}
+    for name, path in videos.items():
+        file_name = f"{name}{os.path.splitext(path)[1]}"
+        stored[name] = os.path.join(entry_dir, file_name)
+        _move_video(path, stored[name])
+        entry["videos"][name] = file_name
+
+    write_json_atomic(os.path.join(entry_dir, "result.json"), entry)
+    return stored
+
+
+def evict_results(cache_dir=RESULT_CACHE_DIR, max_bytes=RESULT_CACHE_MAX_BYTES, max_age_days=RESULT_CACHE_MAX_AGE_DAYS):
+    if not os.path.isdir(cache_dir):
+        return 0
+    entries = []
+    total = 0
+    removed = 0
+    for name in os.listdir(cache_dir):
+        entry_dir = os.path.join(cache_dir, name)
+        entry = _read_entry(entry_dir)
+        if entry is None:
+            continue
+        if time.time() - entry["created"] > max_age_days * 86400:
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            removed += 1
+            continue
+        size = _dir_size(entry_dir)
+        entries.append((os.path.getmtime(os.path.join(entry_dir, "result.json")), size, entry_dir))
+        total += size
+
+    for last_used, size, entry_dir in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        total -= size
+        removed += 1
+    return removed
@@ -0,0 +1,144 @@
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.catalogue import operation_for_script, video_path
+from utils.render_worker import run_manim
+from utils.renderer import (
+    PROJECT_ROOT, cache_args, collect_outputs, evict_cache, find_scenes, manim_env, profile_flags, save_to_cache,
+)
+
+SHARD_DIR = os.path.join(PROJECT_ROOT, "build", "shards")
+
+
+def _count_in_this_process(script_path, scene_name):
+    import importlib.util
+    from manim import tempconfig
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script_path)))
+    spec = importlib.util.spec_from_file_location("sharded_scene", script_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    # A dry run executes construct() without writing any frames
+    with tempconfig({"dry_run": True, "disable_caching": True, "verbosity": "ERROR"}):
+        scene = getattr(module, scene_name)()
+        scene.render()
+        return scene.renderer.num_plays
+
+
+def count_animations(script_path, scene_name):
+    result = subprocess.run(
+        [sys.executable, "-m", "utils.shard_render", "--count", script_path, "--scene", scene_name],
+        capture_output=True, text=True, env=manim_env(), cwd=PROJECT_ROOT
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Could not count animations in {script_path}:\n{result.stderr}")
+    return int(result.stdout.strip().splitlines()[-1])
+
+
+def shard_ranges(total, shards):
+    # Contiguous, inclusive (first, last) animation numbers, as manim's -n expects
+    shards = max(1, min(shards, total))
+    size, remainder = divmod(total, shards)
+    ranges = []
+    first = 0
+    for index in range(shards):
+        last = first + size + (1 if index < remainder else 0) - 1
+        ranges.append((first, last))
+        first = last + 1
+    return ranges
+
+
+def render_shard(script_path, scene_name, first, last, media_dir, flags):
+    with open(script_path, "r", encoding="utf-8") as file:
+        script_content = file.read()
+    result = run_manim(
+        [*flags, script_path, scene_name, "-n", f"{first},{last}", *cache_args(media_dir, script_content)],
+        cwd=PROJECT_ROOT
+    )
+    save_to_cache(media_dir)
+    collect_outputs(result, media_dir, scene_name, os.path.join(media_dir, "segment.mp4"))
+    if not result.ok:
+        raise RuntimeError(f"Animations {first}-{last} failed:\n{result.error_message}")
+    return result.video_path, result.wall_time
+
+
+def concatenate_videos(segment_paths, output_path):
+    # Segments share codec settings, so the concat demuxer can join them without re-encoding
+    list_path = f"{output_path}.segments.txt"
+    with open(list_path, "w", encoding="utf-8") as file:
+        for path in segment_paths:
+            file.write(f"file '{os.path.abspath(path)}'\n")
+    result = subprocess.run(
+        ["ffmpeg", "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy", output_path],
+        capture_output=True, text=True
+    )
+    os.remove(list_path)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not join the segments:\n{result.stderr}")
+    return output_path
+
+
+def render_sharded(script_path, scene_name, output_path, shards=None, profile="publish"):
+    script_path = os.path.abspath(script_path)
+    shards = shards or os.cpu_count()
+    total = count_animations(script_path, scene_name)
+    if total == 0:
+        raise RuntimeError(f"{scene_name} does not play any animations")
+    ranges = shard_ranges(total, shards)
+    work_dir = os.path.join(SHARD_DIR, os.path.splitext(os.path.basename(script_path))[0])
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+    with ProcessPoolExecutor(max_workers=len(ranges)) as executor:
+        futures = [
+            executor.submit(render_shard, script_path, scene_name, first, last, os.path.join(work_dir, str(index)), profile_flags(profile))
+            for index, (first, last) in enumerate(ranges)
+        ]
+        segments = [future.result() for future in futures]
+    evict_cache()
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    concatenate_videos([path for path, seconds in segments], output_path)
+    return total, ranges, [seconds for path, seconds in segments]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render one scene as parallel animation ranges and join the segments.")
+    parser.add_argument("script", help="Scene script, e.g. scripts/joining/4_outer_join.py")
+    parser.add_argument("--scene", help="Scene class to render (default: the first one in the script)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="Number of animation ranges to render in parallel")
+    parser.add_argument("--profile", default="publish", choices=["preview", "publish"], help="Render profile")
+    parser.add_argument("-o", "--output", help="Output MP4 (default: the catalogue video for this script)")
+    parser.add_argument("--count", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    with open(args.script, "r", encoding="utf-8") as file:
+        scene_name = args.scene or find_scenes(file.read())[0]
+
+    if args.count:
+        print(_count_in_this_process(args.script, scene_name))
+        return 0
+
+    output_path = args.output
+    if output_path is None:
+        operation = operation_for_script(os.path.relpath(os.path.abspath(args.script), PROJECT_ROOT))
+        if operation is not None:
+            output_path = video_path(operation, os.path.join(PROJECT_ROOT, "videos"))
+        else:
+            output_path = os.path.join(PROJECT_ROOT, "build", f"{scene_name}.mp4")
+
+    start = time.perf_counter()
+    total, ranges, seconds = render_sharded(args.script, scene_name, output_path, args.jobs, args.profile)
+    print(f"{total} animations in {len(ranges)} ranges")
+    for (first, last), elapsed in zip(ranges, seconds):
+        print(f"  animations {first:>3}-{last:<3} {elapsed:>7.1f}s")
+    print(f"Wall clock {time.perf_counter() - start:.1f}s -> {output_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,50 @@
+import argparse
+import os
+import sys
+import time
+
+from streamlit.testing.v1 import AppTest
+
+from utils.file_operations import PROJECT_ROOT
+
+# Runs app.py headless, as a cold start would, and checks that the catalogue
+# tabs render within a time budget without secrets and without importing an
+# LLM SDK. Those are only needed once someone generates a video.
+STARTUP_BUDGET_SECONDS = float(os.environ.get("STARTUP_BUDGET_SECONDS", 10))
+LLM_SDK_MODULES = ("openai", "google.generativeai")
+
+
+def check_startup(budget=STARTUP_BUDGET_SECONDS):
+    # Returns the time the first run took and a list of problems
+    os.chdir(PROJECT_ROOT)
+    for name in ("OPENAI_API_KEY", "GOOGLE_API_KEY"):
+        os.environ.pop(name, None)
+    start = time.perf_counter()
+    app = AppTest.from_file(os.path.join(PROJECT_ROOT, "app.py"), default_timeout=max(budget, 1) * 2)
+    app.run()
+    elapsed = time.perf_counter() - start
+
+    problems = [f"app.py raised: {exception.message}" for exception in app.exception]
+    if len(app.tabs) < 6:
+        problems.append(f"Expected 6 tabs, found {len(app.tabs)}")
+    problems += [f"{name} was imported at startup" for name in LLM_SDK_MODULES if name in sys.modules]
+    if elapsed > budget:
+        problems.append(f"Startup took {elapsed:.2f}s, over the {budget:.2f}s budget")
+    return elapsed, problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that the app starts quickly without secrets or LLM SDKs.")
+    parser.add_argument("--budget", type=float, default=STARTUP_BUDGET_SECONDS, help="Maximum seconds for the first run")
+    args = parser.parse_args(argv)
+
+    elapsed, problems = check_startup(args.budget)
+    for problem in problems:
+        print(f"FAILED: {problem}")
+    if not problems:
+        print(f"App started in {elapsed:.2f}s without secrets or LLM SDK imports.")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
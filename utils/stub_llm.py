@@ -0,0 +1,25 @@
+import hashlib
+
+# Offline backend for development and tests: answers every prompt with the
+# same small scene, titled from a digest of the prompt, so runs are
+# deterministic and need no API key or network.
+STUB_SCRIPT = """from manim import *
+
+class StubScene(Scene):
+    def construct(self):
+        title = Text("Stub {digest}")
+        self.play(Write(title))
+        self.wait(1)
+"""
+
+
+def is_retryable(error):
+    return False
+
+
+async def complete(prompt, model, system_message, on_text=None):
+    digest = hashlib.sha256(prompt.encode()).hexdigest()[:8]
+    text = f"Here is the script:\n\n```python\n{STUB_SCRIPT.format(digest=digest)}```\n"
+    if on_text is not None:
+        on_text(text)
+    return text